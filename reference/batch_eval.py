@@ -0,0 +1,45 @@
+from board_util import win_lines
+from evaluation import LineValues
+from playouts import encode
+import numpy as np
+
+TABLE_MAX_K = 10 #above this the 3**k line values are looked up per distinct code instead of tabled
+
+class BatchEvaluator:
+    # the batch version of IncrementalEvaluator: scores many boards at once, each the sum of
+    # line_score over its lines. boards are int8 arrays from playouts.encode, one row per board.
+    # the line membership matrix holds 3**pos for every cell of every line, so a single matrix
+    # product turns the boards into the same base-3 line codes (0 empty, 1 own, 2 enemy) that
+    # IncrementalEvaluator keeps, and the scores are lookups into a table of code values
+
+    def __init__(self, line_score, dim, piece, k=None):
+        self.line_score = line_score
+        self.dim = dim
+        self.k = k = k or dim
+        self.piece = piece
+        self.enemy = 'x' if piece == 'o' else 'o'
+        line_coords = [coords for _, coords in win_lines(dim, k)]
+        # float so the product goes through BLAS, codes stay exact far beyond any usable k
+        self.membership = np.zeros((dim*dim, len(line_coords)))
+        for li, coords in enumerate(line_coords):
+            self.membership[list(coords), li] = 3**np.arange(len(coords))
+        self.digits = np.array([0, 1, 2] if piece == 'x' else [0, 2, 1], dtype=float)
+        self.values = LineValues(line_score, k, piece, self.enemy)
+        self.table = np.array([self.values[code] for code in range(3**k)]) if k <= TABLE_MAX_K else None
+
+    def codes(self, boards):
+        return (self.digits[boards] @ self.membership).astype(np.int64)
+
+    def scores(self, boards):
+        codes = self.codes(boards)
+        if self.table is not None:
+            return self.table[codes].sum(axis=1)
+        distinct, inverse = np.unique(codes, return_inverse=True)
+        values = np.array([self.values[code] for code in distinct.tolist()])
+        return values[inverse].reshape(codes.shape).sum(axis=1)
+
+def children(board, cells, value):
+    # one copy of the encoded board per cell in cells, with the piece value (1 x, 2 o) placed there
+    boards = np.repeat(board[None, :], len(cells), axis=0)
+    boards[np.arange(len(cells)), cells] = value
+    return boards
@@ -0,0 +1,203 @@
+from engines import Engine
+from registry import available_engines
+from board_util import check_win, lines, board_str
+from solved import table_path
+from contextlib import redirect_stdout
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import timeit
+
+SKIP = {'human': 'reads its moves from stdin'}
+UNTIMED_MAX_DIM = {'minimax': 3} #searches to the end of the game whatever the clock says
+HIGHER_IS_BETTER = ('nodes_per_s', 'depth')
+STARTUP_MODULES = ('ttt', 'check', 'tournament') #what every command line run and game worker imports
+STARTUP_HEAVY = ('engines', 'numpy') #only wanted once an engine is made
+
+def positions(dim, k, count, seed=0):
+    # the same mid-game positions every run for a given seed: random games stopped after a
+    # random number of moves, skipping any that are already over
+    rng = random.Random(f'{seed}-{dim}-{k}')
+    boards = []
+    while len(boards) < count:
+        board = ['-']*(dim*dim)
+        for i, cell in enumerate(rng.sample(range(dim*dim), rng.randrange(dim*dim//2 + 1))):
+            board[cell] = 'xo'[i % 2]
+        board = ''.join(board)
+        if not check_win(board, dim, k=k):
+            boards.append(board)
+    return boards
+
+def skip_reason(name, dim, k):
+    if name in SKIP:
+        return SKIP[name]
+    if dim > UNTIMED_MAX_DIM.get(name, dim):
+        return 'ignores the clock, too slow on this board'
+    if name == 'solved' and not os.path.exists(table_path(dim, k)):
+        return f'no table, build it with solved.py -d{dim} -k{k}'
+    return None
+
+def bench_engine(name, dim, k, boards, time_limit):
+    # time to move, nodes/s and time to reach each depth, one fresh engine per position
+    move_times, nodes, depths, depth_times = [], 0, [], {}
+    for board in boards:
+        piece = 'x' if board.count('x') == board.count('o') else 'o'
+        with redirect_stdout(io.StringIO()): #engines report on every move
+            engine = available_engines[name](piece, dim, k)
+            engine.verbose = False
+            try:
+                engine.time_remaining = time_limit
+                start = time.perf_counter()
+                engine.get_move(board)
+                move_times.append(time.perf_counter() - start)
+            finally:
+                engine.close()
+        nodes += engine.moves_checked
+        if hasattr(engine, 'depth_times'):
+            depths.append(engine.depth_reached)
+            for depth, t in enumerate(engine.depth_times, 1):
+                depth_times.setdefault(depth, []).append(t)
+    results = {'move_s': sum(move_times)/len(move_times)}
+    if nodes:
+        results['nodes_per_s'] = nodes/sum(move_times)
+    if depths:
+        results['depth'] = sum(depths)/len(depths)
+        for depth, times in depth_times.items():
+            results[f'depth{depth}_s'] = sum(times)/len(times)
+    return results
+
+def bench_micro(dim, k, boards):
+    # microseconds per call, best of a few timing runs over all the positions
+    engine = Engine('x', dim, k)
+    funcs = {
+        'check_win': lambda b: check_win(b, dim, k=k),
+        'lines': lambda b: list(lines(b, dim, k=k)),
+        'possible_moves': lambda b: list(engine.possible_moves(b, 'x')),
+        'board_str': lambda b: board_str(b, dim),
+    }
+    results = {}
+    for name, f in funcs.items():
+        timer = timeit.Timer(lambda: [f(b) for b in boards])
+        number, _ = timer.autorange()
+        results[name] = 1e6 * min(timer.repeat(3, number)) / (number*len(boards))
+    return results
+
+def bench_startup(modules=STARTUP_MODULES, runs=5):
+    # microseconds to import each module in a fresh interpreter, from python -X importtime, best of a
+    # few runs, and the number of modules it loaded. also returns the STARTUP_HEAVY modules each one loaded
+    here = os.path.dirname(os.path.abspath(__file__))
+    results, heavy = {}, {}
+    for module in modules:
+        best = None
+        for _ in range(runs):
+            out = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                                 cwd=here, capture_output=True, text=True, check=True).stderr
+            imported = {}
+            for line in out.splitlines():
+                fields = line.split('|')
+                if len(fields) == 3 and fields[1].strip().isdigit():
+                    imported[fields[2].strip()] = int(fields[1])
+            best = imported[module] if best is None else min(best, imported[module])
+        results[f'import/{module}/us'] = best
+        results[f'import/{module}/modules'] = len(imported)
+        heavy[module] = [name for name in STARTUP_HEAVY if name in imported]
+    return results, heavy
+
+def run(engines, dims, k=None, count=5, time_limit=10, seed=0, micro=True):
+    metrics, skipped = {}, {}
+    for dim in dims:
+        dk = min(k or dim, dim)
+        size = f'{dim}x{dim}k{dk}'
+        boards = positions(dim, dk, count, seed)
+        for name in engines:
+            reason = skip_reason(name, dim, dk)
+            if reason is None:
+                print(f'{name} {size}...', file=sys.stderr)
+                try:
+                    results = bench_engine(name, dim, dk, boards, time_limit)
+                except ImportError as e: #optional dependency missing
+                    reason = str(e)
+            if reason is not None:
+                skipped[f'{name}/{size}'] = reason
+                continue
+            for metric, value in results.items():
+                metrics[f'{name}/{size}/{metric}'] = value
+        if micro:
+            for name, value in bench_micro(dim, dk, boards).items():
+                metrics[f'{name}/{size}/us'] = value
+    return metrics, skipped
+
+def compare(metrics, baseline, threshold):
+    # (key, old, new, change) for every metric that got worse by more than threshold
+    regressions = []
+    for key, new in metrics.items():
+        old = baseline.get(key)
+        if not old or not new:
+            continue
+        change = new/old - 1
+        worse = -change if key.rsplit('/', 1)[1] in HIGHER_IS_BETTER else change
+        if worse > threshold:
+            regressions.append((key, old, new, change))
+    return regressions
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the engines and board helpers on fixed positions.')
+    parser.add_argument('engines', type=str, nargs='*', help=f'engines to benchmark (default: all of {", ".join(available_engines)})')
+    parser.add_argument('--dims', '-d', type=int, nargs='+', default=[3, 4, 5], help='board sizes')
+    parser.add_argument('--k', '-k', type=int, default=None, help='number in a row needed to win (default: size of board)')
+    parser.add_argument('--positions', '-p', type=int, default=5, help='positions per board size')
+    parser.add_argument('--time', '-t', type=float, default=10, help='clock given to the engine for each move')
+    parser.add_argument('--seed', '-s', type=int, default=0, help='seed for the positions')
+    parser.add_argument('--no-micro', action='store_true', help='skip the board helper microbenchmarks')
+    parser.add_argument('--no-startup', action='store_true', help='skip the import time benchmark')
+    parser.add_argument('--out', '-o', type=str, default='bench.json', help='file to write the results to')
+    parser.add_argument('--baseline', '-b', type=str, default=None, help='earlier results to compare against')
+    parser.add_argument('--threshold', type=float, default=0.15, help='relative slowdown counted as a regression')
+    args = parser.parse_args()
+    for name in args.engines:
+        if name not in available_engines:
+            parser.error(f'unknown engine {name}')
+    engines = args.engines or list(available_engines)
+    metrics, skipped = run(engines, args.dims, args.k, args.positions, args.time, args.seed, not args.no_micro)
+    heavy = {}
+    if not args.no_startup:
+        print('startup...', file=sys.stderr)
+        startup, heavy = bench_startup()
+        metrics.update(startup)
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['metrics']
+    for key, value in metrics.items():
+        old = baseline.get(key)
+        change = f'  {100*(value/old - 1):+6.1f}%' if old else ''
+        print(f'{key:<36} {value:12.4g}{change}')
+    for key, reason in skipped.items():
+        print(f'{key:<36} skipped: {reason}')
+    with open(args.out, 'w') as f:
+        json.dump({
+            'meta': {'seed': args.seed, 'positions': args.positions, 'time': args.time,
+                     'python': platform.python_version(), 'date': time.strftime('%Y-%m-%d %H:%M:%S')},
+            'metrics': metrics,
+            'skipped': skipped,
+        }, f, indent=2)
+    # importing an engine up front is a regression with or without a baseline
+    failed = False
+    for module, found in heavy.items():
+        if found:
+            print(f'REGRESSION import {module} loads {", ".join(found)} before any engine is made')
+            failed = True
+    if args.baseline:
+        regressions = compare(metrics, baseline, args.threshold)
+        for key, old, new, change in regressions:
+            print(f'REGRESSION {key}: {old:.4g} -> {new:.4g} ({100*change:+.1f}%)')
+        print(f'{len(regressions)} regressions beyond {100*args.threshold:.0f}% against {args.baseline}')
+        failed = failed or bool(regressions)
+    if failed:
+        sys.exit(1)
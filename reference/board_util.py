@@ -1,33 +1,37 @@
 from itertools import chain
 import sys
 
-sys.stdout.reconfigure(encoding='utf-8')
-# print('imported board_util')
-if sys.stdout.isatty():
-    # print('IN A TTY!', file=sys.stderr)
-    class Color:
-        GREEN = '\u001b[32m'
-        RESET = '\u001b[0m'
-        BLUE = '\u001b[34m'
-        MAGENTA = '\u001b[35m'
-        CYAN = '\u001b[36m'
-        BLACK = '\u001b[30m'
-        RED = '\u001b[31m'
-        YELLOW = '\u001b[33m'
-        WHITE = '\u001b[37m'
-else:
-    # print('NOT IN A TTY!', file=sys.stderr)
-    # print(sys.stdout.encoding, file=sys.stderr)
-    class Color:
-        GREEN = ''
-        RESET = ''
-        BLUE = ''
-        MAGENTA = ''
-        CYAN = ''
-        BLACK = ''
-        RED = ''
-        YELLOW = ''
-        WHITE = ''
+class Color:
+    GREEN = '\u001b[32m'
+    RESET = '\u001b[0m'
+    BLUE = '\u001b[34m'
+    MAGENTA = '\u001b[35m'
+    CYAN = '\u001b[36m'
+    BLACK = '\u001b[30m'
+    RED = '\u001b[31m'
+    YELLOW = '\u001b[33m'
+    WHITE = '\u001b[37m'
+
+class NoColor:
+    GREEN = ''
+    RESET = ''
+    BLUE = ''
+    MAGENTA = ''
+    CYAN = ''
+    BLACK = ''
+    RED = ''
+    YELLOW = ''
+    WHITE = ''
+
+def colors():
+    # checked when something is printed rather than on import, stdout may have been swapped since
+    return Color if sys.stdout.isatty() else NoColor
+
+def utf8_stdout():
+    # boards are drawn with box characters, which consoles defaulting to another encoding can't print
+    reconfigure = getattr(sys.stdout, 'reconfigure', None)
+    if reconfigure is not None and (sys.stdout.encoding or '').lower().replace('-', '') != 'utf8':
+        reconfigure(encoding='utf-8')
 
 def board_str(board, dim=3, highlight=(-1,), hi_color=Color.GREEN):
     b = board
@@ -38,7 +42,7 @@ def board_str(board, dim=3, highlight=(-1,), hi_color=Color.GREEN):
         # out += f'│{b[0]}│{b[1]}│{b[2]}│\n'
         out += '│'
         for x in range(dim):
-            if y*dim + x in highlight:
+            if y*dim + x in highlight and hi_color:
                 out += hi_color + b[y*dim + x] + Color.RESET + '│'
             else:
                 out += b[y*dim + x] + '│'
@@ -50,51 +54,108 @@ def board_str(board, dim=3, highlight=(-1,), hi_color=Color.GREEN):
     # out += '└─┴─┴─┘\n'
     return out
 
-def rows(board, dim=3, coords=False):
+def stats_str(stats):
+    out = f"{stats['nodes']} nodes, {stats['leaves']} leaves, {stats['cutoffs']} cutoffs, {stats['tt_hits']} tt hits"
+    if stats['depth']:
+        ply_times = ' '.join(f'{t:.3f}' for t in stats['ply_times'])
+        out += f", depth {stats['depth']}, ebf {stats['ebf']:.2f}, ply times {ply_times}"
+    return out + f", {stats['time']:.2f}s"
+
+class NullRenderer:
+    # output of a game in ttt.py. messages are a format string plus arguments, so a headless
+    # game never builds any text: the null renderer drops everything before it's formatted
+
+    headless = True
+
+    def message(self, text, *args):
+        pass
+
+    def board(self, board, dim, highlight=(-1,), hi_color=None):
+        pass
+
+    def stats(self, stats):
+        pass
+
+    def countdown(self, seconds):
+        pass
+
+class PlainRenderer(NullRenderer):
+
+    headless = False
+
+    def __init__(self):
+        utf8_stdout()
+
+    def message(self, text, *args):
+        print(text.format(*args) if args else text)
+
+    def board(self, board, dim, highlight=(-1,), hi_color=None):
+        # no colours, highlighted cells (the last move, the winning line) are upper case instead
+        print(board_str(''.join(c.upper() if i in highlight else c for i, c in enumerate(board)), dim))
+
+    def stats(self, stats):
+        print(f'search stats: {stats_str(stats)}')
 
-    for row_start in range(0, dim*(dim-1) + 1, dim):
+    def countdown(self, seconds):
+        print(f'time remaining: {seconds:.1f}s')
+
+class AnsiRenderer(PlainRenderer):
+
+    def board(self, board, dim, highlight=(-1,), hi_color=None):
+        print(board_str(board, dim, highlight, hi_color or Color.GREEN))
+
+renderers = {'ansi': AnsiRenderer, 'plain': PlainRenderer, 'none': NullRenderer}
+
+_line_tables = {}
+_win_masks = {}
+_rays = {}
+
+def line_table(dim, k=None):
+    # (rows, cols, diags) as tuples of cell indices, built once per board size and win length.
+    # with k < dim every line is a window of k cells
+    k = k or dim
+    if (dim, k) not in _line_tables:
+        span = range(dim - k + 1)
+        rows_ = tuple(tuple(y*dim + x + j for j in range(k)) for y in range(dim) for x in span)
+        cols_ = tuple(tuple((y + j)*dim + x for j in range(k)) for x in range(dim) for y in span)
+        diags_ = tuple(tuple((y + j)*dim + x + j for j in range(k)) for y in span for x in span) + \
+                 tuple(tuple((y + j)*dim + x - j for j in range(k)) for y in span for x in range(k - 1, dim))
+        _line_tables[(dim, k)] = rows_, cols_, diags_
+    return _line_tables[(dim, k)]
+
+def _line_strs(board, table, coords):
+    for line_coords in table:
+        line = ''.join([board[i] for i in line_coords])
         if coords:
-            yield board[row_start:row_start + dim], tuple(range(row_start, row_start + dim))
+            yield line, line_coords
+        else:
+            yield line
+
+def rows(board, dim=3, coords=False, k=None):
+    if k and k != dim:
+        yield from _line_strs(board, line_table(dim, k)[0], coords)
+        return
+    for row_start, row_coords in zip(range(0, dim*dim, dim), line_table(dim)[0]):
+        if coords:
+            yield board[row_start:row_start + dim], row_coords
         else:
             yield board[row_start:row_start + dim]
     # yield board[0:3]
     # yield board[3:6]
     # yield board[6:9]
 
-def cols(board, dim=3, coords=False):
-    rows_ = [r for r, _ in rows(board, dim, coords=True)]
-    for x, col in enumerate(zip(*rows_)):
-        if coords:
-            yield ''.join(col), tuple(range(x, dim*dim, dim))
-        else:
-            yield ''.join(col)
+def cols(board, dim=3, coords=False, k=None):
+    return _line_strs(board, line_table(dim, k)[1], coords)
     # yield board[0] + board[3] + board[6]
     # yield board[1] + board[4] + board[7]
     # yield board[2] + board[5] + board[8]
 
-def diags(board, dim=3, coords=False):
-    out = ''
-    coords_ = []
-    for i in range(dim):
-        out += board[i*dim + i]
-        coords_.append(i*dim + i)
-    if coords:
-        yield out, tuple(coords_)
-    else:
-        yield out
-    out = ''
-    coords_ = []
-    for i in range(dim):
-        out += board[(i+1)*dim - (i+1)]
-        coords_.append((i+1)*dim - (i+1))
-    if coords:
-        yield out, tuple(coords_)
-    else:
-        yield out
+def diags(board, dim=3, coords=False, k=None):
+    return _line_strs(board, line_table(dim, k)[2], coords)
     # yield board[0] + board[4] + board[8]
     # yield board[2] + board[4] + board[6]
 
-lines = lambda x, dim, coords=False: chain(rows(x, dim, coords), cols(x, dim, coords), diags(x, dim, coords)) #TODO: adapt for 4x4
+lines = lambda x, dim, coords=False, k=None: chain(rows(x, dim, coords, k), cols(x, dim, coords, k), diags(x, dim, coords, k))
 
 def all_equal(iterator):
     iterator = iter(iterator)
@@ -106,22 +167,224 @@ def all_equal(iterator):
         return first
     return False
 
-def check_win(board, dim=3, coords=False):
-    for line in lines(board, dim):
-        # print(line, line_coords)
-        char = all_equal(line) 
-        if char and char in 'ox':
-            return char
+_X_BITS = str.maketrans('xo- ', '1000')
+_O_BITS = str.maketrans('xo- ', '0100')
+
+def win_lines(dim, k=None):
+    # (mask, coords) for every winning line, built once per board size and win length
+    k = k or dim
+    if (dim, k) not in _win_masks:
+        _win_masks[(dim, k)] = tuple((sum(1 << i for i in line_coords), line_coords)
+                                     for line_coords in chain(*line_table(dim, k)))
+    return _win_masks[(dim, k)]
+
+def rays(dim, k=None):
+    # for each cell, one (forward, backward) pair per direction (row, column, both diagonals),
+    # each holding up to k-1 cells going outward from the cell
+    k = k or dim
+    if (dim, k) not in _rays:
+        table = []
+        for cell in range(dim*dim):
+            y, x = divmod(cell, dim)
+            pairs = []
+            for dy, dx in ((0, 1), (1, 0), (1, 1), (1, -1)):
+                pair = []
+                for sign in (1, -1):
+                    ray = []
+                    for j in range(1, k):
+                        yy, xx = y + sign*j*dy, x + sign*j*dx
+                        if not (0 <= yy < dim and 0 <= xx < dim):
+                            break
+                        ray.append(yy*dim + xx)
+                    pair.append(tuple(ray))
+                pairs.append(tuple(pair))
+            table.append(tuple(pairs))
+        _rays[(dim, k)] = tuple(table)
+    return _rays[(dim, k)]
+
+def bits_win_run(bits, cell, dim, k=None):
+    # scans outward from cell in each direction, returns the cells of a run of at least k, or None
+    k = k or dim
+    for forward, backward in rays(dim, k)[cell]:
+        nf = 0
+        for i in forward:
+            if not bits >> i & 1:
+                break
+            nf += 1
+        nb = 0
+        for i in backward:
+            if not bits >> i & 1:
+                break
+            nb += 1
+        if nf + nb + 1 >= k:
+            return backward[:nb][::-1] + (cell,) + forward[:nf]
+    return None
+
+def str_win_run(board, cell, dim, k=None):
+    k = k or dim
+    piece = board[cell]
+    for forward, backward in rays(dim, k)[cell]:
+        nf = 0
+        for i in forward:
+            if board[i] != piece:
+                break
+            nf += 1
+        nb = 0
+        for i in backward:
+            if board[i] != piece:
+                break
+            nb += 1
+        if nf + nb + 1 >= k:
+            return backward[:nb][::-1] + (cell,) + forward[:nf]
+    return None
+
+class Bitboard:
+    # each player's pieces as an int, bit i set if that player holds cell i
+
+    __slots__ = ('dim', 'x', 'o', 'k')
+
+    def __init__(self, dim=3, x=0, o=0, k=None):
+        self.dim = dim
+        self.x = x
+        self.o = o
+        self.k = k or dim
+
+    @classmethod
+    def from_str(cls, board, dim=3, k=None):
+        rev = board[::-1]
+        return cls(dim, int(rev.translate(_X_BITS), 2), int(rev.translate(_O_BITS), 2), k)
+
+    def to_str(self):
+        x, o = self.x, self.o
+        return ''.join('x' if x >> i & 1 else 'o' if o >> i & 1 else '-' for i in range(self.dim*self.dim))
+
+    def place(self, cell, piece):
+        if piece == 'x':
+            return Bitboard(self.dim, self.x | 1 << cell, self.o, self.k)
+        return Bitboard(self.dim, self.x, self.o | 1 << cell, self.k)
+
+    def empty_cells(self):
+        taken = self.x | self.o
+        return [i for i in range(self.dim*self.dim) if not taken >> i & 1]
+
+    def check_win(self):
+        x, o = self.x, self.o
+        for mask, _ in win_lines(self.dim, self.k):
+            if x & mask == mask:
+                return 'x'
+            if o & mask == mask:
+                return 'o'
+        return False
+
+    def check_win_coords(self):
+        x, o = self.x, self.o
+        for mask, line_coords in win_lines(self.dim, self.k):
+            if x & mask == mask:
+                return 'x', line_coords
+            if o & mask == mask:
+                return 'o', line_coords
+        return False, None
+
+    def check_win_after(self, cell):
+        # only a run through the last move can have been completed by it
+        piece, bits = ('x', self.x) if self.x >> cell & 1 else ('o', self.o)
+        if bits_win_run(bits, cell, self.dim, self.k) is not None:
+            return piece
+        return False
+
+    def check_win_after_coords(self, cell):
+        piece, bits = ('x', self.x) if self.x >> cell & 1 else ('o', self.o)
+        run = bits_win_run(bits, cell, self.dim, self.k)
+        if run is not None:
+            return piece, run
+        return False, None
+
+    def check_tie(self):
+        return (self.x | self.o) == (1 << self.dim*self.dim) - 1
+
+    def __eq__(self, other):
+        return isinstance(other, Bitboard) and (self.dim, self.k, self.x, self.o) == (other.dim, other.k, other.x, other.o)
+
+    def __hash__(self):
+        return hash((self.dim, self.k, self.x, self.o))
+
+    def __str__(self):
+        return self.to_str()
+
+class BoardState(Bitboard):
+    # mutable board for searches: make_move/unmake_move update it in place instead of
+    # building a new board string for every child
+
+    __slots__ = ('cells', 'to_move', 'undo')
+    __hash__ = None
+
+    def __init__(self, board, dim=3, k=None):
+        b = Bitboard.from_str(board, dim)
+        super().__init__(dim, b.x, b.o, k)
+        self.cells = list(board)
+        self.to_move = 'x' if board.count('x') == board.count('o') else 'o'
+        self.undo = []
+
+    def make_move(self, cell):
+        piece = self.to_move
+        self.cells[cell] = piece
+        if piece == 'x':
+            self.x |= 1 << cell
+            self.to_move = 'o'
+        else:
+            self.o |= 1 << cell
+            self.to_move = 'x'
+        self.undo.append(cell)
+
+    def unmake_move(self):
+        cell = self.undo.pop()
+        piece = self.cells[cell]
+        self.cells[cell] = '-'
+        if piece == 'x':
+            self.x ^= 1 << cell
+        else:
+            self.o ^= 1 << cell
+        self.to_move = piece
+        return cell
+
+    def key(self):
+        return self.x, self.o
+
+    def to_str(self):
+        return ''.join(self.cells)
+
+def check_win(board, dim=3, coords=False, k=None):
+    if not isinstance(board, Bitboard):
+        board = Bitboard.from_str(board, dim, k)
+    return board.check_win()
+
+def check_win_coords(board, dim=3, k=None):
+    if not isinstance(board, Bitboard):
+        board = Bitboard.from_str(board, dim, k)
+    return board.check_win_coords()
+
+def check_win_after(board, cell, dim=3, k=None):
+    # cheaper check_win when only the piece just placed at cell can have won
+    if isinstance(board, Bitboard):
+        return board.check_win_after(cell)
+    if board[cell] not in 'ox':
+        return False
+    if str_win_run(board, cell, dim, k) is not None:
+        return board[cell]
     return False
 
-def check_win_coords(board, dim=3):
-    for line, line_coords in lines(board, dim, coords=True):
-        # print(line, line_coords)
-        char = all_equal(line) 
-        if char and char in 'ox':
-            return char, line_coords
+def check_win_after_coords(board, cell, dim=3, k=None):
+    if isinstance(board, Bitboard):
+        return board.check_win_after_coords(cell)
+    if board[cell] not in 'ox':
+        return False, None
+    run = str_win_run(board, cell, dim, k)
+    if run is not None:
+        return board[cell], run
     return False, None
 
 
 def check_tie(board):
+    if isinstance(board, Bitboard):
+        return board.check_tie()
     return '-' not in board
\ No newline at end of file
@@ -0,0 +1,133 @@
+from board_util import board_str, colors
+from registry import available_engines
+from check import result_key
+from ttt import GameResult
+from server import REMOTE
+import argparse
+import asyncio
+import json
+import random
+import time
+
+# clients for server.py: 'load' keeps a number of games in flight and reports throughput and
+# move latency, 'play' plays one game against a server engine from the terminal
+
+async def connect(host, port, unix):
+    if unix is not None:
+        return await asyncio.open_unix_connection(unix)
+    return await asyncio.open_connection(host, port)
+
+async def send(writer, **message):
+    writer.write(json.dumps(message).encode() + b'\n')
+    await writer.drain()
+
+def percentile(values, p):
+    # nearest rank on sorted values
+    return values[min(len(values) - 1, int(p/100 * len(values)))]
+
+async def load(host, port, unix, games, concurrency, players, dim, k, time_limit):
+    reader, writer = await connect(host, port, unix)
+    new_game = dict(type='new_game', players=players, dim=dim, k=k, time=time_limit)
+    start = time.perf_counter()
+    for _ in range(min(concurrency, games)):
+        await send(writer, **new_game)
+    requested = min(concurrency, games)
+    last_event = {} #game -> time of its last message, a move's latency is the gap since the previous one
+    latencies = []
+    results = {}
+    done = 0
+    while done < games:
+        line = await reader.readline()
+        if not line:
+            raise ConnectionError('server closed the connection')
+        message = json.loads(line)
+        kind, game, now = message['type'], message.get('game'), time.perf_counter()
+        if kind == 'started':
+            last_event[game] = now
+        elif kind == 'moved':
+            latencies.append(now - last_event[game])
+            last_event[game] = now
+        elif kind == 'your_move': #remote side plays random moves
+            cell = random.choice([i for i, space in enumerate(message['board']) if space == '-'])
+            await send(writer, type='move', game=game, cell=cell)
+        elif kind == 'result':
+            del last_event[game]
+            key = result_key(GameResult(message['winner'], message['reason']))
+            results[key] = results.get(key, 0) + 1
+            done += 1
+            if requested < games:
+                await send(writer, **new_game)
+                requested += 1
+        elif kind == 'error':
+            raise RuntimeError(message['message'])
+    elapsed = time.perf_counter() - start
+    writer.close()
+    latencies.sort()
+    print(f'{games} games ({players[0]} vs {players[1]}, {dim}x{dim}, {concurrency} at a time) in {elapsed:.2f}s: '
+          f'{games/elapsed:.1f} games/s')
+    print('results: ' + '  '.join(f'{key}: {count}' for key, count in sorted(results.items())))
+    if latencies:
+        ms = lambda t: f'{1000*t:.1f}ms'
+        print(f'move latency over {len(latencies)} moves: p50 {ms(percentile(latencies, 50))}  p90 {ms(percentile(latencies, 90))}  '
+              f'p99 {ms(percentile(latencies, 99))}  max {ms(latencies[-1])}')
+
+async def play(host, port, unix, engine, second, dim, k, time_limit):
+    # moves are typed in the same way as in ttt.py, HumanEngine reads them in a thread
+    reader, writer = await connect(host, port, unix)
+    players = [engine, REMOTE] if second else [REMOTE, engine]
+    await send(writer, type='new_game', players=players, dim=dim, k=k, time=time_limit)
+    loop = asyncio.get_running_loop()
+    me = players.index(REMOTE)
+    human = available_engines['human'](piece='xo'[me], dim=dim, k=k)
+    while True:
+        line = await reader.readline()
+        if not line:
+            raise ConnectionError('server closed the connection')
+        message = json.loads(line)
+        kind = message['type']
+        if kind == 'your_move':
+            board = message['board']
+            print(f'time remaining: {message["time_remaining"]:.1f}s')
+            move = await loop.run_in_executor(None, human.get_move, board)
+            cell = [i for i in range(len(board)) if move[i] != board[i]][0]
+            await send(writer, type='move', game=message['game'], cell=cell)
+        elif kind == 'moved' and message['player'] != me:
+            print(f'{engine} played ({message["think"]:.2f}s):')
+            print(board_str(message['board'], dim=dim, highlight=(message['cell'],), hi_color=colors().CYAN))
+        elif kind == 'result':
+            print(board_str(message['board'], dim=dim))
+            if message['winner'] == -1:
+                print('DRAW: game ends in a draw')
+            else:
+                outcome = 'you win' if message['winner'] == me else f'{engine} wins'
+                print(f'{message["reason"].upper()}: {outcome}! {message.get("message", "")}')
+            writer.close()
+            return
+        elif kind == 'error':
+            raise RuntimeError(message['message'])
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Play games on a server.py match server.')
+    parser.add_argument('--host', type=str, default='127.0.0.1', help='server address')
+    parser.add_argument('--port', '-p', type=int, default=8765, help='server TCP port')
+    parser.add_argument('--unix', '-u', type=str, default=None, help='connect to this unix socket instead of TCP')
+    parser.add_argument('--dim', '-d', type=int, default=3, help='size of board')
+    parser.add_argument('--k', '-k', type=int, default=None, help='number in a row needed to win (default: size of board)')
+    parser.add_argument('--time', '-t', type=float, default=30, help='each player\'s time limit')
+    commands = parser.add_subparsers(dest='command', required=True)
+    load_parser = commands.add_parser('load', help='run many games and report games/s and move latency')
+    load_parser.add_argument('engine1', type=str, choices=[REMOTE] + list(available_engines), help='player 1 (remote: random moves from this client)')
+    load_parser.add_argument('engine2', type=str, choices=[REMOTE] + list(available_engines), help='player 2')
+    load_parser.add_argument('--games', '-g', type=int, default=200, help='number of games to play')
+    load_parser.add_argument('--concurrency', '-c', type=int, default=100, help='games in flight at once')
+    play_parser = commands.add_parser('play', help='play a game yourself')
+    play_parser.add_argument('engine', type=str, choices=available_engines, metavar='engine', help='engine to play against (%(choices)s)')
+    play_parser.add_argument('--second', action='store_true', help='play o instead of x')
+    args = parser.parse_args()
+    if args.k is not None and not 1 <= args.k <= args.dim:
+        parser.error('k must be between 1 and the size of the board')
+    if args.command == 'load':
+        asyncio.run(load(args.host, args.port, args.unix, args.games, args.concurrency,
+                         [args.engine1, args.engine2], args.dim, args.k, args.time))
+    else:
+        asyncio.run(play(args.host, args.port, args.unix, args.engine, args.second, args.dim, args.k, args.time))
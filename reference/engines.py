@@ -1,39 +1,119 @@
 from itertools import cycle, chain
-from board_util import check_win, check_tie, board_str, lines, Color
+from board_util import check_win, check_win_after, check_tie, board_str, lines, win_lines, bits_win_run, Bitboard, BoardState, colors
+from transposition import TranspositionTable, EXACT, LOWER, UPPER
+from evaluation import IncrementalEvaluator
+from symmetry import symmetries, SymmetricTable
+from threats import ThreatSearch
+import math
+import os
 import random
 import time
-import traceback
+
+batch_eval = None
+
+def load_batch_eval():
+    # imported by the first engine that wants it, numpy is slow to import and optional:
+    # without it every leaf is scored on its own
+    global batch_eval
+    if batch_eval is None:
+        try:
+            import batch_eval
+        except ImportError:
+            batch_eval = False
+    return batch_eval
 
 class Engine:
 
     engine_name = 'base tictactoe engine'
+    default_time = 30 #assumed clock when get_move is called without time_remaining
+    safety_margin = 0.5 #seconds kept back for process/harness overhead
+    moves_per_k = 4 #expected moves each player still makes, per cell of k in a row
 
-    def __init__(self, piece, dim):
+    def __init__(self, piece, dim, k=None):
         self.piece = piece
         self.enemy = 'x' if piece == 'o' else 'o'
         self.dim = dim
+        self.k = k or dim #number in a row needed to win
+        self.time_remaining = None #seconds left on this engine's clock, set before each get_move
+        self.moves_checked = 0 #positions searched for the last move
+        self.leaves = 0 #positions scored without searching further (heuristic or finished game)
+        self.cutoffs = 0 #moves skipped by pruning
+        self.profile_dir = None #set to a directory to dump a cProfile of every move there
+        self.verbose = True #per-move reports, turned off for headless games
         
-    def get_move_wrapper(self, board, *args, **kwargs): #don't worry about this too much
+    def get_move_wrapper(self, board, time_remaining=None, *args, **kwargs): #don't worry about this too much
+        # returns (success, move or exception, search stats)
+        self.time_remaining = time_remaining
+        self.moves_checked = self.leaves = self.cutoffs = 0
+        tt = getattr(self, 'tt', None)
+        tt_hits = tt.hits if tt is not None else 0
+        start = time.time()
         try:
-            return True, self.get_move(board, *args, **kwargs)
+            if self.profile_dir is None:
+                move = self.get_move(board, *args, **kwargs)
+            else:
+                move = self.profiled_move(board, *args, **kwargs)
         except Exception as e:
-            print(f'\n{Color.RED}ERROR: exception in {self}{Color.RESET}\n')
+            import traceback
+            color = colors()
+            print(f'\n{color.RED}ERROR: exception in {self}{color.RESET}\n')
             print('board state during exception:')
             print(board_str(board))
             traceback.print_exc()
             print()
-            return False, e
+            return False, e, self.search_stats(time.time() - start, 0)
+        return True, move, self.search_stats(time.time() - start, tt.hits - tt_hits if tt is not None else 0)
+
+    def profiled_move(self, board, *args, **kwargs):
+        # one profile file per move, named after the engine class, piece and move number
+        import cProfile
+        profile = cProfile.Profile()
+        try:
+            return profile.runcall(self.get_move, board, *args, **kwargs)
+        finally:
+            move_number = self.dim*self.dim - board.count('-')
+            profile.dump_stats(os.path.join(self.profile_dir, f'{type(self).__name__}_{self.piece}_{move_number:03d}.prof'))
+
+    def search_stats(self, elapsed, tt_hits):
+        # plain dict so it can go back over the worker pipe. engines that don't deepen report depth 0
+        depth = getattr(self, 'depth_reached', 0)
+        depth_times = getattr(self, 'depth_times', [])
+        nodes = self.moves_checked
+        return {
+            'nodes': nodes,
+            'leaves': self.leaves,
+            'cutoffs': self.cutoffs,
+            'tt_hits': tt_hits,
+            'depth': depth,
+            'ebf': nodes ** (1/depth) if depth and nodes else 0, #effective branching factor
+            'ply_times': [t - prev for prev, t in zip([0] + depth_times, depth_times)],
+            'time': elapsed,
+        }
 
     def get_move(self, board):
         raise NotImplementedError('You need to implement get_move')
 
+    def close(self):
+        pass #called once the game is over, for engines holding processes or files
+
+    def ponder(self, board, stop):
+        pass #called with the board after our move, may think on the opponent's time until stop() is true
+
+    def time_budget(self, board):
+        # share what's left of the clock evenly over our remaining moves: one per pair of empty cells,
+        # but no more than a game to k in a row usually lasts, with k < dim it ends long before the board fills
+        time_remaining = self.default_time if self.time_remaining is None else self.time_remaining
+        time_remaining = max(time_remaining - self.safety_margin, 0.01)
+        moves_left = min((board.count('-') + 1)//2, self.moves_per_k*self.k)
+        return time_remaining/max(moves_left, 1), time_remaining
+
     def possible_moves(self, board, piece):
         for i, space in enumerate(board):
             if space in '- ':
                 yield board[:i] + piece + board[i+1:]
 
     def __hash__(self):
-        return hash((type(self).__name__, self.piece, self.enemy, self.dim))
+        return hash((type(self).__name__, self.piece, self.enemy, self.dim, self.k))
 
     def __str__(self):
         return f'<{self.engine_name} [{self.piece}]>'
@@ -44,7 +124,8 @@ class RandomEngine(Engine):
 
     def get_move(self, board):
         # raise Exception('testing exceptions')
-        print('beep boop randomizing move...')
+        if self.verbose:
+            print('beep boop randomizing move...')
         b = list(board)
         choices = [i for i, pc in enumerate(board) if pc == '-']
         b[random.choice(choices)] = self.piece
@@ -68,16 +149,14 @@ class HumanEngine(Engine):
         print('\n'.join(out))
         # ok = False
         while True:
-            inp = input(f'Please enter a coordinate pair to place \'{self.piece}\' (such as B2 or 1A): ')
-            if len(inp) != 2:
-                print('A coordinate pair must be two characters.')
-                continue
-            sorted_ = sorted(list(inp)) #sort based on ascii values to allow both orderings as input
-            if not(sorted_[0].isdigit() and sorted_[1].isalpha()):
-                print('Please include one letter and one digit.')
+            inp = input(f'Please enter a coordinate pair to place \'{self.piece}\' (such as B2 or 1A): ').strip()
+            letters = [c for c in inp if c.isalpha()]
+            digits = ''.join(c for c in inp if c.isdigit()) #any number of digits so boards wider than 9 work
+            if len(letters) != 1 or not digits or len(letters) + len(digits) != len(inp):
+                print('Please include one letter and one number.')
                 continue
-            x = int(sorted_[0]) - 1
-            y = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'.index(sorted_[1].upper())
+            x = int(digits) - 1
+            y = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'.index(letters[0].upper())
             if not (0 <= x < self.dim and 0 <= y < self.dim):
                 print('That cell is not in the grid.')
                 continue
@@ -87,113 +166,913 @@ class HumanEngine(Engine):
             else:
                 print('That cell is not empty.')
 
+SYMMETRIC_TT_MAX_DIM = 5 #canonical keys cost more than they save past the opening on bigger boards
+
 class MinimaxEngine(Engine):
     
     engine_name = 'vanilla minimax'
 
-    def __init__(self, *args, **kwargs):
-        self.moves_checked = 0
+    def __init__(self, *args, tt_mb=64, symmetry=True, **kwargs):
+        # symmetry: only search one of each group of moves that are the same by symmetry, and on
+        # boards up to SYMMETRIC_TT_MAX_DIM keep one tt entry for all the symmetric copies of a
+        # position (see symmetry.py)
         super().__init__(*args, **kwargs)
+        self.symmetry = symmetry
+        self.sym = symmetries(self.dim)
+        self.tt = TranspositionTable(tt_mb) #kept for the whole game
+        if symmetry and self.dim <= SYMMETRIC_TT_MAX_DIM:
+            self.tt = SymmetricTable(self.tt, self.dim)
 
     def get_move(self, board):
-        move, _ = self.minimax_helper(board, True)
+        self.moves_checked = 0
+        state = BoardState(board, self.dim, self.k)
+        syms = self.sym.stabilizer(state.x, state.o) if self.symmetry else ()
+        cell, _ = self.minimax_helper(state, True, syms)
         # print('chose move with score', score, move)
-        return move
+        return board[:cell] + self.piece + board[cell+1:]
 
-    def minimax_helper(self, board, maximizing=True):
+    def minimax_helper(self, state, maximizing=True, syms=()):
+        # syms: symmetries of the board that still hold, moves they map onto each other are searched once
+        self.moves_checked += 1
+        key = state.key()
+        hit, score, move = self.tt.probe(key, 0) #full-depth search, so any stored entry is exact
+        # the root is always searched, so ties go to the lowest cell. an entry stored from a symmetric
+        # position can hold a different one of the tied moves
+        if hit and state.undo:
+            return move, score
         f = max if maximizing else min
-        winner = check_win(board, self.dim)
-        if winner == self.piece:
-            return None, 1
-        elif winner == self.enemy:
-            return None, -1
-        elif check_tie(board):
-            return None, 0
+        winner = state.check_win_after(state.undo[-1]) if state.undo else state.check_win()
+        if winner or state.check_tie():
+            self.leaves += 1
+            return None, 1 if winner == self.piece else -1 if winner == self.enemy else 0
         move_scores = {}
-        for move in self.possible_moves(board, self.piece if maximizing else self.enemy):
-            _, score = self.minimax_helper(move, not maximizing)
-            move_scores[move] = score
+        for cell in self.sym.distinct(state.empty_cells(), syms):
+            state.make_move(cell)
+            _, score = self.minimax_helper(state, not maximizing, self.sym.fixing(syms, cell))
+            state.unmake_move()
+            move_scores[cell] = score
         # print(move_scores)
         best_move, best_score = f(move_scores.items(), key=lambda p: p[1])
         best_score *= 3/4
+        self.tt.store(key, best_score, 0, EXACT, best_move)
         return best_move, best_score
 
+BATCH_MIN_DIM = 5
+THREATS_MIN_DIM = 6
+
+class SearchTimeout(Exception):
+    pass
+
 class DLMinimaxEngine(Engine):
 
     engine_name = 'depth limited minimax'
-    # max_depth = 5
+    max_depth = None #optional cap, otherwise iterative deepening goes as deep as the clock allows
+    ponder_all_max = 16 #ponder on every reply when there are at most this many, otherwise on the likeliest few
+    ponder_width = 3
+    threat_share = 0.2 #of the move's budget, for the threat search before the normal search
 
-    def __init__(self, *args, **kwargs):
-        self.moves_checked = 0
-        self.max_depth = [100, 100, 100, 100, 5, 4][kwargs['dim']]
+    def __init__(self, *args, tt_mb=64, batch_leaves=None, symmetry=True, threats=None, **kwargs):
+        self.depth_reached = 0
+        self.depth_times = [] #seconds into the last move at which each depth finished
+        self.deadline = None
+        self.stop = None #set while pondering, true once the opponent's move is in
+        self.pondered = {} #reply board -> (move, score, depth) from pondering
+        self.tt_mb = tt_mb
+        self.symmetry = symmetry #see MinimaxEngine
         super().__init__(*args, **kwargs)
+        self.sym = symmetries(self.dim)
+        self.tt = TranspositionTable(tt_mb) #kept for the whole game
+        if symmetry and self.dim <= SYMMETRIC_TT_MAX_DIM:
+            self.tt = SymmetricTable(self.tt, self.dim)
+        self.evaluator = IncrementalEvaluator(self.line_heuristic, self.dim, self.piece, self.k)
+        # score the leaves under each depth 1 node in one numpy call. only pays off once there are
+        # enough children per node to cover the call overhead, so by default only on big boards
+        if batch_leaves is None:
+            batch_leaves = self.dim >= BATCH_MIN_DIM
+        self.batch = batch_eval.BatchEvaluator(self.line_heuristic, self.dim, self.piece, self.k) if batch_leaves and load_batch_eval() else None
+        # look for forced wins and losses by threat sequences before searching. on small boards the
+        # normal search sees as far, so by default only on big ones
+        if threats is None:
+            threats = self.dim >= THREATS_MIN_DIM
+        self.threats = ThreatSearch(self.dim, self.k) if threats else None
+        self.root_filter = None #the only moves the root may play, set when the threat search finds a forced loss to stop
 
     def get_move(self, board):
-        move, _ = self.minimax_helper(board, True, self.max_depth)
-        return move
+        return self.iterative_deepening(board)
+
+    def prepare(self, board, age_history=True):
+        pass #per-position setup before search, see AlphaBetaEngine
+
+    def search(self, board, depth):
+        self.evaluator.reset(board)
+        state = BoardState(board, self.dim, self.k)
+        syms = self.sym.stabilizer(state.x, state.o) if self.symmetry else ()
+        cell, score = self.minimax_helper(state, True, depth, syms)
+        return board[:cell] + self.piece + board[cell+1:], score
+
+    def decided(self, score, depth):
+        return abs(score) == float('inf')
+
+    def iterative_deepening(self, board):
+        # deepen one ply at a time, only starting the next iteration if it's predicted to fit
+        # in the budget. the hard deadline aborts an iteration that overruns its prediction.
+        # after pondering the tt is warm, so the depths already searched go by quickly
+        start = time.time()
+        self.depth_reached = 0
+        self.depth_times = []
+        self.moves_checked = 0
+        pondered, self.pondered = self.pondered.get(board), {}
+        if pondered is not None:
+            move, score, depth = pondered
+            if self.decided(score, depth): #settled while the opponent was thinking
+                self.depth_reached = depth
+                return move
+        budget, time_remaining = self.time_budget(board)
+        if self.threats is not None:
+            move = self.threat_prepass(board, start + self.threat_share*budget)
+            if move is not None:
+                self.depth_times = [time.time() - start]
+                return move
+        self.root_ready(board)
+        self.deadline = start + min(2*budget, time_remaining)
+        max_depth = board.count('-')
+        if self.max_depth is not None:
+            max_depth = min(max_depth, self.max_depth)
+        best_move = next(self.possible_moves(board, self.piece))
+        if self.root_filter:
+            cell = self.root_filter[0]
+            best_move = board[:cell] + self.piece + board[cell+1:]
+        prev_time = last_time = 0
+        growths = [] #iteration time ratios, odd and even depths often differ
+        try:
+            for depth in range(1, max_depth + 1):
+                t = time.time()
+                move, score = self.search(board, depth)
+                best_move, self.depth_reached = move, depth
+                self.depth_times.append(time.time() - start)
+                prev_time, last_time = last_time, time.time() - t
+                if self.decided(score, depth):
+                    break
+                if prev_time > 0:
+                    growths = growths[-1:] + [last_time/prev_time]
+                # no growth measured after depth 1 yet, guess a pruned search's sqrt(moves) per ply
+                growth = max(growths) if growths else math.sqrt(board.count('-'))
+                if time.time() - start + last_time*growth > budget:
+                    break
+        except SearchTimeout:
+            pass
+        finally:
+            self.deadline = None
+            self.root_filter = None
+        return best_move
+
+    def root_ready(self, board):
+        pass #called once the root moves are settled (root_filter set), before the first iteration
+
+    def threat_prepass(self, board, deadline):
+        # returns the first move of a forced win if there is one. otherwise, if the opponent is
+        # threatening one, sets root_filter to the moves that stop it (unless none do)
+        b = Bitboard.from_str(board, self.dim, self.k)
+        me, opp = (b.x, b.o) if self.piece == 'x' else (b.o, b.x)
+        nodes = self.threats.nodes
+        try:
+            line = self.threats.forced_win(me, opp, deadline)
+            if line is not None:
+                self.depth_reached = len(line)
+                return board[:line[0]] + self.piece + board[line[0]+1:]
+            self.root_filter = self.threats.defenses(me, opp, deadline) or None
+            return None
+        finally:
+            self.moves_checked += self.threats.nodes - nodes
+
+    def out_of_time(self):
+        if self.stop is not None:
+            return self.stop()
+        return self.deadline is not None and time.time() > self.deadline
+
+    def ponder(self, board, stop):
+        # search the opponent's replies to our move, one depth at a time across all of them, until
+        # their move arrives. fills the tt and keeps each reply's result for iterative_deepening
+        if check_win(board, self.dim, k=self.k) or check_tie(board):
+            return
+        replies = self.reply_order(board)
+        if len(replies) > self.ponder_all_max:
+            replies = replies[:self.ponder_width]
+        boards = [board[:cell] + self.enemy + board[cell+1:] for cell in replies]
+        boards = [b for b, cell in zip(boards, replies) if not check_win_after(b, cell, self.dim, self.k) and not check_tie(b)]
+        self.stop = stop
+        try:
+            for depth in range(1, board.count('-')):
+                for reply in boards:
+                    if reply in self.pondered and self.decided(*self.pondered[reply][1:]):
+                        continue
+                    self.prepare(reply, age_history=False)
+                    move, score = self.search(reply, depth)
+                    self.pondered[reply] = move, score, depth
+        except SearchTimeout:
+            pass
+        finally:
+            self.stop = None
+
+    def reply_order(self, board):
+        # empty cells, the reply our last search expected first
+        b = Bitboard.from_str(board, self.dim, self.k)
+        _, _, expected = self.tt.probe((b.x, b.o), 0)
+        cells = [i for i, space in enumerate(board) if space == '-']
+        if expected in cells:
+            cells.remove(expected)
+            cells.insert(0, expected)
+        return cells
+
+    def check_time(self):
+        self.moves_checked += 1
+        if self.moves_checked & 255 == 0 and self.out_of_time():
+            raise SearchTimeout()
 
     def heuristic(self, board):
+        return sum(self.line_heuristic(line) for line in lines(board, self.dim, k=self.k))
+
+    def line_heuristic(self, line):
+        # the search uses this through self.evaluator, which keeps the board's total up to date move by move
         p, e = self.piece, self.enemy
         h = 0
-        for line in lines(board, self.dim):
-            for n in range(1, self.dim):
-                if '-' + p*n in line or p*n + '-' in line:
-                    h += 10**n
-                if '-' + e*n in line or e*n + '-' in line:
-                    h -= 10**n  
-            # if f'-{e}{e}{e}' in line or f'{e}{e}{e}-' in line:
-            #     h -= 100
-            # if f'-{p}{p}' in line or f'{p}{p}-' in line:
-            #     h += 10
-            # if f'-{e}{e}' in line or f'{e}{e}-' in line:
-            #     h -= 10
+        for n in range(1, self.k):
+            if '-' + p*n in line or p*n + '-' in line:
+                h += 10**n
+            if '-' + e*n in line or e*n + '-' in line:
+                h -= 10**n  
+        # if f'-{e}{e}{e}' in line or f'{e}{e}{e}-' in line:
+        #     h -= 100
+        # if f'-{p}{p}' in line or f'{p}{p}-' in line:
+        #     h += 10
+        # if f'-{e}{e}' in line or f'{e}{e}-' in line:
+        #     h -= 10
         return h
 
-    def minimax_helper(self, board, maximizing=True, depth=4):
+    def minimax_helper(self, state, maximizing=True, depth=4, syms=()):
+        self.check_time()
+        key = state.key()
+        hit, score, move = self.tt.probe(key, depth)
+        if hit and state.undo: #see MinimaxEngine
+            return move, score
         f = max if maximizing else min
-        winner = check_win(board, self.dim)
-        if winner == self.piece:
-            return None, float('inf')
-        if winner == self.enemy:
-            return None, float('-inf')
-        if check_tie(board):
-            return None, 0
-        if depth == 0:
-            return None, self.heuristic(board)
-        move_scores = {}
-        for move in self.possible_moves(board, self.piece if maximizing else self.enemy):
-            _, score = self.minimax_helper(move, not maximizing, depth-1)
-            move_scores[move] = score
+        winner = state.check_win_after(state.undo[-1]) if state.undo else state.check_win()
+        if winner or depth == 0 or state.check_tie():
+            self.leaves += 1
+            if winner == self.piece:
+                return None, float('inf')
+            if winner == self.enemy:
+                return None, float('-inf')
+            return None, 0 if state.check_tie() else self.evaluator.total
+        cells = self.sym.distinct(state.empty_cells(), syms)
+        if self.root_filter and not state.undo:
+            cells = [cell for cell in cells if cell in self.root_filter]
+        if depth == 1 and self.batch is not None:
+            move_scores = self.frontier_scores(state, cells)
+        else:
+            move_scores = {}
+            piece = state.to_move
+            evaluator = self.evaluator
+            for cell in cells:
+                state.make_move(cell)
+                evaluator.make(cell, piece)
+                _, score = self.minimax_helper(state, not maximizing, depth-1, self.sym.fixing(syms, cell))
+                evaluator.unmake(cell, piece)
+                state.unmake_move()
+                move_scores[cell] = score
         # print(move_scores)
         best_move, best_score = f(move_scores.items(), key=lambda p: p[1])
         best_score *= 3/4
+        self.tt.store(key, best_score, depth, EXACT, best_move)
         return best_move, best_score
 
+    def frontier_scores(self, state, cells):
+        # the depth 0 half of minimax_helper for every child at once: cached and finished children
+        # are handled one by one, the rest are collected and go through a single batch evaluation
+        move_scores = {}
+        leaves = []
+        for cell in cells:
+            self.check_time()
+            state.make_move(cell)
+            hit, score, _ = self.tt.probe(state.key(), 0)
+            if not hit:
+                self.leaves += 1
+                winner = state.check_win_after(cell)
+                if winner == self.piece:
+                    score = float('inf')
+                elif winner == self.enemy:
+                    score = float('-inf')
+                elif state.check_tie():
+                    score = 0
+                else:
+                    leaves.append(cell)
+            state.unmake_move()
+            move_scores[cell] = score #keeps the move order for ties, leaves are filled in below
+        if leaves:
+            value = 1 if state.to_move == 'x' else 2
+            batch_eval = load_batch_eval() #engines sent to a spawned worker haven't loaded it there yet
+            boards = batch_eval.children(batch_eval.encode(state.to_str()), leaves, value)
+            for cell, score in zip(leaves, self.batch.scores(boards).tolist()):
+                move_scores[cell] = score
+        return move_scores
+
 class GreedyEngine(Engine):
 
     engine_name = 'greedy'
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.batch = batch_eval.BatchEvaluator(self.line_heuristic, self.dim, self.piece, self.k) if load_batch_eval() else None
+
     def get_move(self, board):
-        moves = list(self.possible_moves(board, self.piece))
-        move_scores = {move: self.heuristic(move) for move in moves}
+        if self.batch is not None:
+            return self.batch_move(board)
+        move_cells = {board[:i] + self.piece + board[i+1:]: i for i, space in enumerate(board) if space == '-'}
+        move_scores = {move: self.heuristic(move, cell) for move, cell in move_cells.items()}
+        self.moves_checked = self.leaves = len(move_scores)
+        moves = list(move_cells)
         random.shuffle(moves)
         move = max(moves, key=lambda m: move_scores[m])
         return move
 
-    def heuristic(self, board):
+    def heuristic(self, board, cell=None):
         p, _ = self.piece, self.enemy
         h = 0
-        if check_win(board, self.dim) == self.piece:
+        winner = check_win(board, self.dim, k=self.k) if cell is None else check_win_after(board, cell, self.dim, self.k)
+        if winner == self.piece:
             return float('inf')
-        for line in lines(board, self.dim):
+        for line in lines(board, self.dim, k=self.k):
             if p+p in line:
                 h += 1
         return h
 
-available_engines = {
-    'random': RandomEngine,
-    'minimax': MinimaxEngine,
-    'dlminimax': DLMinimaxEngine,
-    'human': HumanEngine,
-    'greedy': GreedyEngine
-}
+    def batch_move(self, board):
+        # every move scored by one batch call, the sum of line_heuristic is inf for a win and
+        # the count of lines with two pieces in a row otherwise, same as heuristic()
+        cells = [i for i, space in enumerate(board) if space == '-']
+        value = 1 if self.piece == 'x' else 2
+        batch_eval = load_batch_eval()
+        scores = self.batch.scores(batch_eval.children(batch_eval.encode(board), cells, value)).tolist()
+        self.moves_checked = self.leaves = len(scores)
+        best = max(scores)
+        cell = random.choice([cell for cell, score in zip(cells, scores) if score == best])
+        return board[:cell] + self.piece + board[cell+1:]
+
+    def line_heuristic(self, line):
+        p = self.piece
+        if line == p*self.k:
+            return float('inf')
+        return 1 if p+p in line else 0
+
+class AlphaBetaEngine(DLMinimaxEngine):
+
+    engine_name = 'alpha-beta'
+
+    # negamax over bitboards, scores are from the side to move's point of view.
+    # a loss at ply p scores -(win_score - p), so faster wins / slower losses are
+    # preferred the same way the 3/4 discount does in MinimaxEngine
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('batch_leaves', False) #negamax scores its leaves with the incremental evaluator
+        super().__init__(*args, **kwargs)
+        dim = self.dim
+        self.full = (1 << dim*dim) - 1
+        self.line_masks = [mask for mask, _ in win_lines(dim, self.k)]
+        self.win_score = 10**(self.k + 1) * len(self.line_masks) #larger than any heuristic value
+        c = (dim - 1)/2
+        self.centre_order = sorted(range(dim*dim), key=lambda i: abs(i//dim - c) + abs(i%dim - c))
+        self.history = [0]*(dim*dim)
+        self.killers = []
+        self.moves_checked = 0
+        self.root = None
+        self.root_syms = ()
+        self.root_best = None
+
+    def get_move(self, board):
+        self.prepare(board)
+        move = self.iterative_deepening(board)
+        if self.verbose:
+            print(f'{self.engine_name}: searched {self.moves_checked} nodes to depth {self.depth_reached}')
+        return move
+
+    def prepare(self, board, age_history=True):
+        b = Bitboard.from_str(board, self.dim, self.k)
+        me, opp = (b.x, b.o) if self.piece == 'x' else (b.o, b.x)
+        self.root = me, opp
+        self.root_syms = self.sym.stabilizer(me, opp) if self.symmetry else ()
+        self.root_best = None
+        self.moves_checked = 0
+        self.killers = [[None, None] for _ in range(self.dim*self.dim + 1)]
+        if age_history:
+            self.history = [h//2 for h in self.history] #age history from the previous move
+
+    def reply_order(self, board):
+        b = Bitboard.from_str(board, self.dim, self.k)
+        me, opp = (b.x, b.o) if self.piece == 'x' else (b.o, b.x)
+        _, _, expected = self.tt.probe((opp, me), 0) #the opponent is to move
+        cells = [cell for cell in self.centre_order if not (me | opp) >> cell & 1]
+        if expected in cells:
+            cells.remove(expected)
+            cells.insert(0, expected)
+        return cells
+
+    def search(self, board, depth):
+        self.evaluator.reset(board)
+        cell, score = self.search_root(*self.root, depth)
+        self.root_best = cell
+        return board[:cell] + self.piece + board[cell+1:], score
+
+    def decided(self, score, depth):
+        # only a win/loss within the searched depth is final, deeper ones may have come from the tt
+        # while a faster win is still hidden past the horizon
+        return abs(score) > self.win_score//2 and self.win_score - abs(score) <= depth
+
+    def wins_with(self, pieces, cell):
+        return bits_win_run(pieces, cell, self.dim, self.k) is not None
+
+    def order_moves(self, me, opp, ply, tt_move=None):
+        # winning moves, then blocks, then tt/killer moves, then by history and distance from centre
+        empty = ~(me | opp) & self.full
+        wins, blocks = [], []
+        for mask in self.line_masks:
+            gap = mask & empty
+            if gap and not gap & (gap - 1): #exactly one empty cell in this line
+                if me & mask == mask ^ gap:
+                    wins.append(gap.bit_length() - 1)
+                elif opp & mask == mask ^ gap:
+                    blocks.append(gap.bit_length() - 1)
+        first = []
+        for cell in chain(wins, blocks, (tt_move,), self.killers[ply]):
+            if cell is not None and empty >> cell & 1 and cell not in first:
+                first.append(cell)
+        history = self.history
+        rest = [i for i in self.centre_order if empty >> i & 1 and i not in first]
+        rest.sort(key=lambda i: -history[i])
+        return first + rest
+
+    def to_tt(self, score, ply):
+        # store win/loss scores relative to the node instead of the root
+        if score > self.win_score//2:
+            return score + ply
+        if score < -self.win_score//2:
+            return score - ply
+        return score
+
+    def from_tt(self, score, ply):
+        if score > self.win_score//2:
+            return score - ply
+        if score < -self.win_score//2:
+            return score + ply
+        return score
+
+    def root_moves(self, me, opp):
+        moves = self.sym.distinct(self.order_moves(me, opp, 0, self.root_best), self.root_syms)
+        if self.root_filter:
+            moves = [cell for cell in moves if cell in self.root_filter]
+        return moves
+
+    def search_root(self, me, opp, depth):
+        # ties are resolved exactly (window best-1) and broken by lowest cell index, like MinimaxEngine
+        best, ties = float('-inf'), []
+        for cell in self.root_moves(me, opp):
+            bit = 1 << cell
+            if self.wins_with(me | bit, cell):
+                score = self.win_score - 1
+            else:
+                self.evaluator.make(cell, self.piece)
+                alpha = best - 1 if ties else float('-inf')
+                try:
+                    child = self.negamax(opp, me | bit, depth - 1, float('-inf'), -alpha, 1,
+                                         self.sym.fixing(self.root_syms, cell))
+                finally:
+                    self.evaluator.unmake(cell, self.piece)
+                score = -child
+            if score > best:
+                best, ties = score, [cell]
+            elif score == best:
+                ties.append(cell)
+        return min(ties), best
+
+    def negamax(self, me, opp, depth, alpha, beta, ply, syms=()):
+        self.moves_checked += 1
+        if self.moves_checked & 1023 == 0 and self.out_of_time():
+            raise SearchTimeout()
+        if me | opp == self.full:
+            self.leaves += 1
+            return 0
+        if depth == 0:
+            self.leaves += 1
+            h = self.evaluator.total
+            return h if ply % 2 == 0 else -h
+        key = (me, opp)
+        hit, score, tt_move = self.tt.probe(key, depth, self.to_tt(alpha, ply), self.to_tt(beta, ply))
+        if hit:
+            return self.from_tt(score, ply)
+        orig_alpha = alpha
+        piece = self.piece if ply % 2 == 0 else self.enemy
+        best, best_move = float('-inf'), None
+        for cell in self.sym.distinct(self.order_moves(me, opp, ply, tt_move), syms):
+            bit = 1 << cell
+            if self.wins_with(me | bit, cell):
+                score = self.win_score - ply - 1
+            else:
+                self.evaluator.make(cell, piece)
+                try:
+                    score = -self.negamax(opp, me | bit, depth - 1, -beta, -alpha, ply + 1, self.sym.fixing(syms, cell))
+                finally:
+                    self.evaluator.unmake(cell, piece)
+            if score > best:
+                best, best_move = score, cell
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta:
+                        self.cutoffs += 1
+                        killers = self.killers[ply]
+                        if killers[0] != cell:
+                            killers[0], killers[1] = cell, killers[0]
+                        self.history[cell] += depth*depth
+                        break
+        if best >= beta:
+            bound = LOWER
+        elif best > orig_alpha:
+            bound = EXACT
+        else:
+            bound = UPPER
+        self.tt.store(key, self.to_tt(best, ply), depth, bound, best_move)
+        return best
+
+class PVSEngine(AlphaBetaEngine):
+
+    engine_name = 'pvs'
+    aspiration_tries = 2 #widenings before a failing side of the window is opened all the way
+
+    # principal variation search (negascout): the first move at each node gets the full window, the
+    # rest a null window that only proves them worse, with a full re-search for any that isn't.
+    # scores are on DLMinimaxEngine's scale, wins are +-inf and the rest the heuristic, so results
+    # can be compared with dlminimax directly. dlminimax's 3/4 per ply discount is the same factor
+    # for every leaf of a fixed depth search, so the search works on the undiscounted heuristic
+    # (whole numbers, which null windows need) and search() applies the discount to the result.
+    # each iteration starts from an aspiration window around the last one's score, and tries the
+    # last principal variation first
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.aspiration = 10**(self.k - 1) #half width of the first window, about one open k-1 run
+        self.pv = [] #principal variation of the last iteration, as cells
+        self.pv_table = [[] for _ in range(self.dim*self.dim + 1)] #pv_table[ply]: best line found from ply
+        self.last_score = None
+
+    def prepare(self, board, age_history=True):
+        super().prepare(board, age_history)
+        self.pv = []
+        self.last_score = None
+
+    def decided(self, score, depth):
+        return abs(score) == float('inf')
+
+    def search(self, board, depth):
+        self.evaluator.reset(board)
+        me, opp = self.root
+        inf = float('inf')
+        alpha, beta = -inf, inf
+        if self.last_score is not None and abs(self.last_score) != inf:
+            alpha, beta = self.last_score - self.aspiration, self.last_score + self.aspiration
+        fails_low = fails_high = 0
+        while True:
+            score = self.pvs(me, opp, depth, alpha, beta, 0, self.root_syms, True)
+            if score <= alpha and alpha != -inf:
+                fails_low += 1
+                alpha = -inf if fails_low > self.aspiration_tries else score - self.aspiration*10**fails_low
+            elif score >= beta and beta != inf:
+                fails_high += 1
+                beta = inf if fails_high > self.aspiration_tries else score + self.aspiration*10**fails_high
+            else:
+                break
+        self.last_score = score
+        self.pv = self.pv_table[0][:]
+        cell = self.root_best
+        return board[:cell] + self.piece + board[cell+1:], score * (3/4)**depth
+
+    def pvs(self, me, opp, depth, alpha, beta, ply, syms=(), on_pv=False):
+        # on_pv: every move so far followed the last principal variation
+        self.moves_checked += 1
+        if self.moves_checked & 1023 == 0 and self.out_of_time():
+            raise SearchTimeout()
+        self.pv_table[ply] = []
+        if me | opp == self.full:
+            self.leaves += 1
+            return 0
+        if depth == 0:
+            self.leaves += 1
+            h = self.evaluator.total
+            return h if ply % 2 == 0 else -h
+        key = (me, opp)
+        hit, score, tt_move = self.tt.probe(key, depth, alpha, beta)
+        if hit and ply: #the root is always searched, so there's a move for search() to play
+            return score
+        orig_alpha = alpha
+        piece = self.piece if ply % 2 == 0 else self.enemy
+        moves = self.sym.distinct(self.order_moves(me, opp, ply, tt_move), syms)
+        if self.root_filter and ply == 0:
+            moves = [cell for cell in moves if cell in self.root_filter]
+        pv_move = self.pv[ply] if on_pv and ply < len(self.pv) else None
+        if pv_move in moves:
+            moves.remove(pv_move)
+            moves.insert(0, pv_move)
+        inf = float('inf')
+        best, best_move = -inf, moves[0] #a lost position still needs a move
+        for i, cell in enumerate(moves):
+            bit = 1 << cell
+            line = [cell]
+            if self.wins_with(me | bit, cell):
+                score = inf
+            else:
+                child_syms = self.sym.fixing(syms, cell)
+                self.evaluator.make(cell, piece)
+                try:
+                    if i == 0 or alpha == -inf: #nothing to prove the move worse than yet
+                        score = -self.pvs(opp, me | bit, depth - 1, -beta, -alpha, ply + 1, child_syms, cell == pv_move)
+                    else:
+                        score = -self.pvs(opp, me | bit, depth - 1, -alpha - 1, -alpha, ply + 1, child_syms)
+                        if alpha < score < beta:
+                            score = -self.pvs(opp, me | bit, depth - 1, -beta, -score, ply + 1, child_syms)
+                finally:
+                    self.evaluator.unmake(cell, piece)
+                line += self.pv_table[ply + 1]
+            if score > best:
+                best, best_move = score, cell
+                if score > alpha:
+                    alpha = score
+                    self.pv_table[ply] = line
+                    if alpha >= beta:
+                        self.cutoffs += 1
+                        killers = self.killers[ply]
+                        if killers[0] != cell:
+                            killers[0], killers[1] = cell, killers[0]
+                        self.history[cell] += depth*depth
+                        break
+        if ply == 0:
+            self.root_best = best_move
+        if best >= beta:
+            bound = LOWER
+        elif best > orig_alpha:
+            bound = EXACT
+        else:
+            bound = UPPER
+        self.tt.store(key, best, depth, bound, best_move)
+        return best
+
+class LazySMPEngine(AlphaBetaEngine):
+
+    engine_name = 'lazy smp alpha-beta'
+
+    # alpha-beta on several cores: helper processes search the same root in a different
+    # root move order (odd helpers one ply deeper) and share everything through a
+    # SharedTranspositionTable. the main process runs the normal timed iterative deepening,
+    # then stops the helpers and plays the deepest result anyone completed
+
+    def __init__(self, *args, helpers=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.helpers = (os.cpu_count() or 1) - 1 if helpers is None else helpers
+        self.helper_procs = None #started on the first move, inside the engine's worker process
+        self.helper_index = None #set in helper processes
+        self.parent_pid = None
+        self.move_id = 0
+        self.helpers_searching = False
+        self.rng = random.Random()
+
+    def get_move(self, board):
+        if self.helper_procs is None:
+            from smp import SharedTranspositionTable, start_helpers
+            self.tt = SharedTranspositionTable(self.tt_mb, self.helpers)
+            if self.symmetry and self.dim <= SYMMETRIC_TT_MAX_DIM:
+                self.tt = SymmetricTable(self.tt, self.dim)
+            self.helper_procs = start_helpers(self, self.helpers)
+        self.move_id += 1
+        self.tt.set_stop(False)
+        self.prepare(board)
+        try:
+            move = self.iterative_deepening(board)
+        finally:
+            self.tt.set_stop(True)
+            if self.helpers_searching:
+                self.helpers_searching = False
+                for _, conn in self.helper_procs:
+                    if conn.poll(1): #helpers notice the stop flag within a few thousand nodes
+                        conn.recv()
+        result = self.tt.best_result(self.move_id)
+        if result is not None and result[0] > self.depth_reached:
+            depth, cell, _ = result
+            move, self.depth_reached = board[:cell] + self.piece + board[cell+1:], depth
+        if self.verbose:
+            print(f'{self.engine_name}: searched {self.moves_checked} nodes (main), depth {self.depth_reached} with {self.helpers} helpers')
+        return move
+
+    def root_ready(self, board):
+        # helpers start after the threat pre-pass, so they keep to the same root moves as the main
+        # search and can't come back with a deeper move the pre-pass showed to lose. no helpers run
+        # for a move the pre-pass (or pondering) settled on its own
+        for _, conn in self.helper_procs:
+            conn.send((board, self.move_id, self.root_filter))
+        self.helpers_searching = True
+
+    def helper_search(self, board, move_id, root_filter=None):
+        self.prepare(board)
+        self.root_filter = root_filter
+        self.rng.seed(self.helper_index*7919 + move_id)
+        try:
+            for depth in range(1 + self.helper_index % 2, board.count('-') + 1):
+                _, score = self.search(board, depth)
+                self.tt.post_result(self.helper_index, move_id, depth, self.root_best, score)
+                if self.decided(score, depth):
+                    break
+        except SearchTimeout:
+            pass
+        finally:
+            self.root_filter = None
+
+    def out_of_time(self):
+        if self.helper_index is not None:
+            return self.tt.stopped() or os.getppid() != self.parent_pid
+        return super().out_of_time()
+
+    def root_moves(self, me, opp):
+        moves = super().root_moves(me, opp)
+        if self.helper_index is not None:
+            self.rng.shuffle(moves)
+        return moves
+
+    def close(self):
+        if self.helper_procs is not None:
+            from smp import stop_helpers
+            stop_helpers(self.helper_procs)
+            self.helper_procs = None
+            self.tt.close()
+
+class MCTSNode:
+
+    # wins are counted for the player who made the move into this node (draws count half)
+
+    __slots__ = ('cell', 'parent', 'children', 'untried', 'to_move', 'winner', 'visits', 'wins')
+
+    def __init__(self, cell, parent, untried, to_move, winner=None):
+        self.cell = cell
+        self.parent = parent
+        self.children = {}
+        self.untried = untried #shuffled, expanded from the end
+        self.to_move = to_move
+        self.winner = winner #'x', 'o' or 'draw' once the game is over
+        self.visits = 0
+        self.wins = 0
+
+class MCTSEngine(Engine):
+
+    engine_name = 'monte carlo tree search'
+    exploration = 1.4
+    leaves_per_batch = 16 #leaves selected (with virtual loss) before one batch of playouts
+    playouts_per_leaf = 32
+
+    # UCT, with the random playouts for a whole batch of leaves run as numpy array operations.
+    # the subtree below the opponent's reply is kept for the next move
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        import playouts #needs numpy, fail when the engine is created rather than on the first move
+        self.tree = None
+        self.tree_board = None
+        self.rng = None
+        self.playouts_per_second = 0
+
+    def new_node(self, cell, parent, board_cells, to_move, winner=None):
+        untried = [] if winner else [i for i, c in enumerate(board_cells) if c == '-']
+        random.shuffle(untried)
+        return MCTSNode(cell, parent, untried, to_move, winner)
+
+    def reuse_tree(self, board):
+        if self.tree is not None:
+            diff = [i for i, (a, b) in enumerate(zip(self.tree_board, board)) if a != b]
+            if len(diff) == 1 and diff[0] in self.tree.children:
+                root = self.tree.children[diff[0]]
+                root.parent = None
+                return root
+        return self.new_node(None, None, board, self.piece)
+
+    def select(self, root, board):
+        # walks down by UCT counting a visit at each node straight away (virtual loss, so the other
+        # leaves in the batch spread out), expands one untried move and returns the new leaf
+        cells = list(board)
+        node, path = root, []
+        while True:
+            node.visits += 1
+            if node.winner or not node.untried and not node.children:
+                return node, cells
+            if node.untried:
+                cell = node.untried.pop()
+                piece = node.to_move
+                cells[cell] = piece
+                if check_win_after(cells, cell, self.dim, self.k):
+                    winner = piece
+                elif '-' not in cells:
+                    winner = 'draw'
+                else:
+                    winner = None
+                child = self.new_node(cell, node, cells, 'o' if piece == 'x' else 'x', winner)
+                node.children[cell] = child
+                child.visits += 1
+                return child, cells
+            log_n = math.log(node.visits)
+            c = self.exploration
+            node = max(node.children.values(), key=lambda ch: ch.wins/ch.visits + c*math.sqrt(log_n/ch.visits))
+            cells[node.cell] = 'o' if node.to_move == 'x' else 'x'
+
+    def backpropagate(self, node, x_wins, o_wins, draws):
+        extra = x_wins + o_wins + draws - 1 #one visit was already counted during selection
+        while node is not None:
+            node.visits += extra
+            node.wins += (o_wins if node.to_move == 'x' else x_wins) + draws/2
+            node = node.parent
+
+    def get_move(self, board):
+        import numpy as np
+        start = time.time()
+        deadline = start + self.time_budget(board)[0]
+        if self.rng is None:
+            self.rng = np.random.default_rng()
+        root = self.reuse_tree(board)
+        playouts = self.grow(root, board, lambda: time.time() >= deadline)
+        elapsed = time.time() - start
+        self.moves_checked = playouts
+        self.playouts_per_second = playouts/elapsed if elapsed > 0 else 0
+        best = max(root.children.values(), key=lambda ch: ch.visits)
+        best.parent = None #the rest of the tree is no use any more
+        self.tree, self.tree_board = best, board[:best.cell] + self.piece + board[best.cell+1:]
+        if self.verbose:
+            print(f'{self.engine_name}: {playouts} playouts in {elapsed:.2f}s ({self.playouts_per_second:.0f} playouts/s), '
+                  f'{root.visits} visits at the root')
+        return self.tree_board
+
+    def grow(self, root, board, done):
+        # batches of selection and playouts until done() or the tree is (nearly) exhausted, returns the playout count
+        import numpy as np
+        from playouts import random_playouts, encode
+        per_leaf = self.playouts_per_leaf
+        playouts = 0
+        solved_batches = 0 #batches where every leaf was a finished game
+        while True:
+            leaves = [self.select(root, board) for _ in range(self.leaves_per_batch)]
+            open_leaves = [(node, cells) for node, cells in leaves if not node.winner]
+            self.leaves += len(leaves)
+            for node, _ in leaves:
+                if node.winner: #finished games need no playouts
+                    self.backpropagate(node, per_leaf*(node.winner == 'x'), per_leaf*(node.winner == 'o'),
+                                       per_leaf*(node.winner == 'draw'))
+            if open_leaves:
+                boards = np.repeat(np.stack([encode(''.join(cells)) for _, cells in open_leaves]), per_leaf, axis=0)
+                to_move = np.repeat(np.array([1 if node.to_move == 'x' else 2 for node, _ in open_leaves], dtype=np.int8), per_leaf)
+                results = random_playouts(boards, to_move, self.dim, self.k, self.rng).reshape(len(open_leaves), per_leaf)
+                for (node, _), row in zip(open_leaves, results):
+                    x_wins = int((row == 1).sum())
+                    o_wins = int((row == 2).sum())
+                    self.backpropagate(node, x_wins, o_wins, per_leaf - x_wins - o_wins)
+                playouts += len(open_leaves)*per_leaf
+                solved_batches = 0
+            else:
+                solved_batches += 1
+            if done() or solved_batches >= 4:
+                return playouts
+
+    def ponder(self, board, stop):
+        # keep growing the tree below our move while the opponent thinks, reuse_tree picks it up next move
+        if self.tree is not None and self.tree_board == board and not self.tree.winner:
+            self.grow(self.tree, board, stop)
+
+class SolvedEngine(Engine):
+
+    engine_name = 'solved'
+
+    # looks every move up in a table built offline by solved.py (3x3 and 4x4 only)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.table = None #opened on the first move, after the engine has been sent to its worker
+
+    def get_move(self, board):
+        from solved import SolvedTable, position_index, X_WINS, O_WINS, DRAW
+        if self.table is None:
+            self.table = SolvedTable(self.dim, self.k)
+        win, lose = (X_WINS, O_WINS) if self.piece == 'x' else (O_WINS, X_WINS)
+        rank = {win: 2, DRAW: 1, lose: 0}
+        index = position_index(board)
+        digit = 1 if self.piece == 'x' else 2
+        best, best_key = None, None
+        for i, space in enumerate(board):
+            if space != '-':
+                continue
+            move = board[:i] + self.piece + board[i+1:]
+            # best game value first, then prefer finishing the game right away
+            key = (rank[self.table.value(index + digit * 3**i)], check_win_after(move, i, self.dim, self.k) == self.piece)
+            if best_key is None or key > best_key:
+                best, best_key = move, key
+        return best
+
+from registry import available_engines #engine classes are looked up by name there
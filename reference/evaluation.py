@@ -0,0 +1,62 @@
+from board_util import win_lines
+
+class LineValues(dict):
+    # base-3 line code (0 empty, 1 own piece, 2 enemy piece, first cell in the lowest digit) -> line_score
+    # of the line as a string, worked out the first time the code is looked up
+
+    def __init__(self, line_score, k, piece, enemy):
+        super().__init__()
+        self.line_score = line_score
+        self.k = k
+        self.piece = piece
+        self.enemy = enemy
+
+    def __missing__(self, code):
+        chars, rest = [], code
+        for _ in range(self.k):
+            rest, digit = divmod(rest, 3)
+            chars.append('-' if digit == 0 else self.piece if digit == 1 else self.enemy)
+        v = self[code] = self.line_score(''.join(chars))
+        return v
+
+class IncrementalEvaluator:
+    # keeps a base-3 code per line (0 empty, 1 own piece, 2 enemy piece) and the running sum of
+    # the per-line scores, so making or undoing a move only re-scores the lines through its cell.
+    # line_score is called with the line as a string, once per distinct line pattern
+
+    def __init__(self, line_score, dim, piece, k=None):
+        self.line_score = line_score
+        self.dim = dim
+        self.k = k or dim
+        self.piece = piece
+        self.enemy = 'x' if piece == 'o' else 'o'
+        self.line_coords = [line_coords for _, line_coords in win_lines(dim, self.k)]
+        self.cell_lines = [[] for _ in range(dim*dim)]
+        for li, line_coords in enumerate(self.line_coords):
+            for pos, cell in enumerate(line_coords):
+                self.cell_lines[cell].append((li, 3**pos))
+        self.values = LineValues(line_score, self.k, self.piece, self.enemy)
+        self.codes = [0]*len(self.line_coords)
+        self.total = 0
+
+    def reset(self, board):
+        digit = {self.piece: 1, self.enemy: 2}
+        self.codes = [sum(digit.get(board[cell], 0) * 3**pos for pos, cell in enumerate(line_coords))
+                      for line_coords in self.line_coords]
+        self.total = sum(self.values[code] for code in self.codes)
+
+    def make(self, cell, piece):
+        d = 1 if piece == self.piece else 2
+        codes, values = self.codes, self.values
+        for li, weight in self.cell_lines[cell]:
+            old = codes[li]
+            codes[li] = new = old + d*weight
+            self.total += values[new] - values[old]
+
+    def unmake(self, cell, piece):
+        d = 1 if piece == self.piece else 2
+        codes, values = self.codes, self.values
+        for li, weight in self.cell_lines[cell]:
+            old = codes[li]
+            codes[li] = new = old - d*weight
+            self.total += values[new] - values[old]
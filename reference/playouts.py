@@ -0,0 +1,43 @@
+from board_util import win_lines
+import numpy as np
+
+# random playouts for many boards at once. boards are int8 arrays (one row per board, one column
+# per cell) with 0 for empty, 1 for x and 2 for o
+
+_line_index = {}
+
+def line_index(dim, k=None):
+    # (lines, k) array of the cells of every winning line
+    k = k or dim
+    if (dim, k) not in _line_index:
+        _line_index[(dim, k)] = np.array([line_coords for _, line_coords in win_lines(dim, k)], dtype=np.intp)
+    return _line_index[(dim, k)]
+
+def encode(board):
+    return np.frombuffer(board.translate(str.maketrans('-xo', '\x00\x01\x02')).encode(), dtype=np.int8)
+
+def random_playouts(boards, to_move, dim, k=None, rng=None):
+    # plays every board out to the end with uniformly random moves, all in a few array operations:
+    # each empty cell gets a random place in the move order, cells at even places go to the side to
+    # move. a line is won at the time its last cell is filled, and the earlier win decides the game.
+    # to_move holds 1 or 2 per board. returns 1 (x won), 2 (o won) or 0 (draw) per board
+    rng = rng or np.random.default_rng()
+    n, cells = boards.shape
+    empty = boards == 0
+    keys = rng.random((n, cells))
+    keys[~empty] = -1 #filled cells sort first
+    order = np.argsort(np.argsort(keys, axis=1), axis=1)
+    filled = cells - empty.sum(axis=1, keepdims=True)
+    place = order - filled #0, 1, 2.. for empty cells in play order, negative for filled ones
+    other = 3 - to_move[:, None]
+    final = np.where(empty, np.where(place % 2 == 0, to_move[:, None], other), boards)
+    lines = line_index(dim, k)
+    line_pieces = final[:, lines] #(boards, lines, k)
+    done_at = place[:, lines].max(axis=2)
+    never = cells + 1
+    x_at = np.where((line_pieces == 1).all(axis=2), done_at, never).min(axis=1)
+    o_at = np.where((line_pieces == 2).all(axis=2), done_at, never).min(axis=1)
+    result = np.zeros(n, dtype=np.int8)
+    result[x_at < o_at] = 1
+    result[o_at < x_at] = 2
+    return result
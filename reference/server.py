@@ -0,0 +1,228 @@
+from board_util import check_win_after, check_tie
+from registry import available_engines
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import asyncio
+import itertools
+import json
+import multiprocessing.util
+import os
+import signal
+import sys
+
+# match server: many games in one event loop, speaking JSON lines over TCP or a unix socket.
+#
+# client -> server
+#   {"type": "new_game", "players": ["alphabeta", "remote"], "dim": 3, "k": 3, "time": 30}
+#   {"type": "move", "game": 1, "cell": 4}
+# server -> client
+#   {"type": "started", "game": 1, "players": [...], "dim": 3, "k": 3, "time": 30}
+#   {"type": "your_move", "game": 1, "board": "----x----", "piece": "o", "time_remaining": 29.5}
+#   {"type": "moved", "game": 1, "player": 0, "cell": 4, "board": "----x----", "think": 0.2, "time_remaining": 29.8}
+#   {"type": "result", "game": 1, "winner": 0, "reason": "win", "board": "..."}
+#   {"type": "error", "message": "..."}
+#
+# players are engine names, or 'remote' for a side the client plays itself (a human or another program).
+# engine moves run in a bounded pool of worker processes, remote moves come back over the connection,
+# and both are held to the player's clock with loop timers. winner and reason are as in ttt.GameResult
+
+REMOTE = 'remote'
+
+_engines = {} #engines kept by each pool worker, so tables and trees carry over between moves
+
+def _init_worker():
+    sys.stdout = open(os.devnull, 'w') #engines report on every move
+    multiprocessing.util.Finalize(None, _close_engines, exitpriority=10)
+
+def _close_engines():
+    for engine in _engines.values():
+        engine.close()
+
+def engine_move(name, piece, dim, k, board, time_remaining):
+    # runs in a pool worker. exceptions come back as text, they might not pickle
+    key = (name, piece, dim, k)
+    engine = _engines.get(key)
+    if engine is None:
+        engine = _engines[key] = available_engines[name](piece=piece, dim=dim, k=k)
+        engine.verbose = False
+    success, result, stats = engine.get_move_wrapper(board, time_remaining)
+    return success, result if success else repr(result), stats
+
+class MoveError(Exception):
+    pass
+
+class Connection:
+    # one client, playing or watching any number of games. moves it owes are futures by game id
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.pending = {}
+        self.closed = False
+
+    async def send(self, **message):
+        if self.closed:
+            return
+        try:
+            self.writer.write(json.dumps(message).encode() + b'\n')
+            await self.writer.drain()
+        except ConnectionError:
+            self.closed = True
+
+class MatchServer:
+
+    def __init__(self, workers):
+        self.workers = workers
+        self.pool = ProcessPoolExecutor(workers, initializer=_init_worker)
+        self.slots = None #one per pool worker, taken before a move is handed to the pool
+        self.game_ids = itertools.count(1)
+        self.games_played = 0
+
+    async def serve(self, host='127.0.0.1', port=8765, unix=None):
+        self.slots = asyncio.Semaphore(self.workers)
+        if unix is not None:
+            server = await asyncio.start_unix_server(self.handle_client, unix)
+        else:
+            server = await asyncio.start_server(self.handle_client, host, port)
+        print(f'serving on {unix or f"{host}:{port}"} with {self.workers} engine workers')
+        async with server:
+            await server.serve_forever()
+
+    def close(self):
+        self.pool.shutdown(cancel_futures=True)
+
+    async def handle_client(self, reader, writer):
+        conn = Connection(reader, writer)
+        games = set()
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except (ConnectionError, ValueError): #ValueError: line over the stream limit
+                    break
+                if not line:
+                    break
+                try:
+                    message = json.loads(line)
+                    kind = message['type']
+                except (ValueError, KeyError, TypeError):
+                    await conn.send(type='error', message='expected a JSON object with a type')
+                    continue
+                if kind == 'new_game':
+                    try:
+                        settings = self.game_settings(message)
+                    except ValueError as e:
+                        await conn.send(type='error', message=str(e))
+                        continue
+                    game = asyncio.create_task(self.play_game(conn, next(self.game_ids), *settings))
+                    games.add(game)
+                    game.add_done_callback(games.discard)
+                elif kind == 'move':
+                    future = conn.pending.get(message.get('game'))
+                    if future is None or future.done():
+                        await conn.send(type='error', message=f'not waiting for a move in game {message.get("game")}')
+                    else:
+                        future.set_result(message.get('cell'))
+                else:
+                    await conn.send(type='error', message=f'unknown message type {kind}')
+        finally:
+            # the client's games have no one to report to any more
+            conn.closed = True
+            for game in games:
+                game.cancel()
+            writer.close()
+
+    def game_settings(self, message):
+        players = message.get('players')
+        dim = message.get('dim', 3)
+        k = message.get('k') or dim
+        time_limit = message.get('time', 30)
+        if not isinstance(players, list) or len(players) != 2:
+            raise ValueError('players must be a list of two engine names or "remote"')
+        for player in players:
+            if player != REMOTE and (player not in available_engines or player == 'human'):
+                raise ValueError(f'unknown player {player}, use an engine name or "remote"')
+        if not isinstance(dim, int) or not isinstance(k, int) or not 1 <= k <= dim:
+            raise ValueError('dim must be a number and k between 1 and dim')
+        if not isinstance(time_limit, (int, float)) or time_limit <= 0:
+            raise ValueError('time must be a positive number of seconds')
+        return players, dim, k, time_limit
+
+    async def play_game(self, conn, game, players, dim, k, time_limit):
+        await conn.send(type='started', game=game, players=players, dim=dim, k=k, time=time_limit)
+        board = '-'*dim*dim
+        times = [time_limit, time_limit]
+        for move in itertools.count():
+            player = move % 2
+            piece = 'xo'[player]
+            try:
+                if players[player] == REMOTE:
+                    cell, think = await self.remote_move(conn, game, board, piece, times[player])
+                else:
+                    cell, think = await self.engine_move(players[player], piece, dim, k, board, times[player])
+            except asyncio.TimeoutError:
+                return await self.finish(conn, game, 1 - player, 'timeout', board)
+            except MoveError as e:
+                return await self.finish(conn, game, 1 - player, 'exception', board, str(e))
+            times[player] -= think
+            board = board[:cell] + piece + board[cell+1:]
+            await conn.send(type='moved', game=game, player=player, cell=cell, board=board, think=think,
+                            time_remaining=times[player])
+            if check_win_after(board, cell, dim, k):
+                return await self.finish(conn, game, player, 'win', board)
+            if check_tie(board):
+                return await self.finish(conn, game, -1, 'draw', board)
+
+    async def finish(self, conn, game, winner, reason, board, message=None):
+        self.games_played += 1
+        result = dict(type='result', game=game, winner=winner, reason=reason, board=board)
+        if message is not None:
+            result['message'] = message
+        await conn.send(**result)
+
+    async def engine_move(self, name, piece, dim, k, board, time_remaining):
+        # the clock starts once a worker is free, so a busy server slows games down instead of
+        # forfeiting them. the slot is only given back when the worker is done, even after a timeout
+        loop = asyncio.get_running_loop()
+        await self.slots.acquire()
+        future = loop.run_in_executor(self.pool, engine_move, name, piece, dim, k, board, time_remaining)
+        future.add_done_callback(lambda _: self.slots.release())
+        start = loop.time()
+        success, result, _ = await asyncio.wait_for(asyncio.shield(future), time_remaining)
+        think = loop.time() - start
+        if not success:
+            raise MoveError(f'{name} raised {result}')
+        changed = [i for i, (old, new) in enumerate(zip(board, result)) if old != new]
+        if len(result) != len(board) or len(changed) != 1 or board[changed[0]] != '-' or result[changed[0]] != piece:
+            raise MoveError(f'{name} made an illegal move')
+        return changed[0], think
+
+    async def remote_move(self, conn, game, board, piece, time_remaining):
+        loop = asyncio.get_running_loop()
+        future = conn.pending[game] = loop.create_future()
+        start = loop.time()
+        try:
+            await conn.send(type='your_move', game=game, board=board, piece=piece, time_remaining=time_remaining)
+            cell = await asyncio.wait_for(future, time_remaining)
+        finally:
+            del conn.pending[game]
+        if not isinstance(cell, int) or not 0 <= cell < len(board) or board[cell] != '-':
+            raise MoveError(f'illegal move {cell!r}')
+        return cell, loop.time() - start
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve tic-tac-toe games to clients over JSON lines.')
+    parser.add_argument('--host', type=str, default='127.0.0.1', help='address to listen on')
+    parser.add_argument('--port', '-p', type=int, default=8765, help='TCP port to listen on')
+    parser.add_argument('--unix', '-u', type=str, default=None, help='listen on this unix socket instead of TCP')
+    parser.add_argument('--workers', '-w', type=int, default=os.cpu_count(), help='engine worker processes')
+    args = parser.parse_args()
+    signal.signal(signal.SIGTERM, signal.default_int_handler) #shut down the pool the same way as on ctrl-c
+    server = MatchServer(args.workers)
+    try:
+        asyncio.run(server.serve(args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        print(f'{server.games_played} games played')
@@ -0,0 +1,144 @@
+from multiprocessing import shared_memory
+from transposition import EXACT, LOWER, UPPER
+import multiprocessing
+import os
+
+SLOT_WORDS = 3 #check, score, info
+RESULT_WORDS = 4 #move id, depth, cell, score
+SCORE_LIMIT = 1 << 62
+
+class SharedTranspositionTable:
+    # same interface as TranspositionTable, but the entries live in shared memory so the main search
+    # and its helper processes all read and write one table. there are no locks: a slot holds
+    # (key ^ score ^ info, score, info), so a slot torn by two writers fails the key check and reads
+    # as a miss. after the table come one result record per helper and a stop flag
+
+    def __init__(self, max_mb=64, helpers=0, name=None):
+        self.max_mb = max_mb
+        self.slots = max(1, int(max_mb * 2**20) // (8*SLOT_WORDS))
+        self.helpers = helpers
+        self.results_at = self.slots*SLOT_WORDS
+        self.stop_at = self.results_at + helpers*RESULT_WORDS
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=8*(self.stop_at + 1))
+            self.owner = True
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            self.owner = False
+            try: #only the creating process should unlink the block at exit
+                from multiprocessing import resource_tracker
+                resource_tracker.unregister(self.shm._name, 'shared_memory')
+            except Exception:
+                pass
+        self.words = self.shm.buf.cast('q')
+        self.hits = 0
+        self.probes = 0
+
+    def __reduce__(self):
+        return SharedTranspositionTable, (self.max_mb, self.helpers, self.shm.name)
+
+    def probe(self, key, depth, alpha=float('-inf'), beta=float('inf')):
+        self.probes += 1
+        h = hash(key)
+        i = h % self.slots * SLOT_WORDS
+        w = self.words
+        check, score, info = w[i], w[i+1], w[i+2]
+        if not info & 1 or check ^ score ^ info != h:
+            return False, None, None
+        move = (info >> 11) - 1
+        move = None if move < 0 else move
+        bound = info >> 9 & 3
+        if info >> 1 & 255 >= depth:
+            if bound == EXACT or (bound == LOWER and score >= beta) or (bound == UPPER and score <= alpha):
+                self.hits += 1
+                return True, score, move
+        return False, None, move
+
+    def store(self, key, score, depth, bound, move):
+        if not isinstance(score, int) or not -SCORE_LIMIT < score < SCORE_LIMIT:
+            return
+        h = hash(key)
+        i = h % self.slots * SLOT_WORDS
+        w = self.words
+        old_info = w[i+2]
+        if old_info & 1 and w[i] ^ w[i+1] ^ old_info == h and old_info >> 1 & 255 > depth:
+            return
+        info = 1 | min(depth, 255) << 1 | bound << 9 | (0 if move is None else move + 1) << 11
+        w[i+1] = score
+        w[i+2] = info
+        w[i] = h ^ score ^ info
+
+    def clear(self):
+        self.words[:self.results_at] = memoryview(bytes(8*self.results_at)).cast('q')
+        self.hits = self.probes = 0
+
+    def __len__(self):
+        return sum(1 for i in range(2, self.results_at, SLOT_WORDS) if self.words[i] & 1)
+
+    def post_result(self, helper, move_id, depth, cell, score):
+        # the move id is cleared while the record is rewritten, so a reader never takes a half-written one
+        j = self.results_at + helper*RESULT_WORDS
+        w = self.words
+        w[j] = -1
+        w[j+1] = depth
+        w[j+2] = cell
+        w[j+3] = max(-SCORE_LIMIT, min(SCORE_LIMIT, score))
+        w[j] = move_id
+
+    def best_result(self, move_id):
+        # deepest (depth, cell, score) any helper finished for this move, or None
+        best = None
+        w = self.words
+        for helper in range(self.helpers):
+            j = self.results_at + helper*RESULT_WORDS
+            result = w[j+1], w[j+2], w[j+3]
+            if w[j] == move_id and (best is None or result[0] > best[0]):
+                best = result
+        return best
+
+    def set_stop(self, stop):
+        self.words[self.stop_at] = int(stop)
+
+    def stopped(self):
+        return self.words[self.stop_at] != 0
+
+    def close(self):
+        self.words.release()
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+def helper_loop(engine, index, conn):
+    # helper process: searches every position the main process sends until told to stop, then acks
+    engine.helper_index = index
+    engine.parent_pid = os.getppid()
+    while True:
+        try:
+            request = conn.recv()
+        except EOFError:
+            return
+        if request is None:
+            return
+        board, move_id, root_filter = request
+        engine.helper_search(board, move_id, root_filter)
+        conn.send(move_id)
+
+def start_helpers(engine, count):
+    helpers = []
+    for index in range(count):
+        conn, helper_conn = multiprocessing.Pipe()
+        p = multiprocessing.Process(target=helper_loop, args=(engine, index, helper_conn), daemon=True)
+        p.start()
+        helpers.append((p, conn))
+    return helpers
+
+def stop_helpers(helpers):
+    for p, conn in helpers:
+        try:
+            conn.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+    for p, conn in helpers:
+        p.join(1)
+        if p.is_alive():
+            p.kill()
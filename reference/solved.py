@@ -0,0 +1,143 @@
+from board_util import win_lines
+import argparse
+import mmap
+import multiprocessing
+import os
+import time
+
+# game-value table for every position of a small board, 2 bits per position, indexed by the
+# base-3 number with digit 0/1/2 for an empty/x/o cell (cell 0 is the least significant digit)
+UNKNOWN, X_WINS, O_WINS, DRAW = 0, 1, 2, 3
+MAGIC = b'TTTS'
+HEADER = 8
+_BASE3 = str.maketrans('-xo ', '0120')
+
+def table_path(dim, k=None):
+    k = k or dim
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), f'solved_{dim}_{k}.bin')
+
+def position_index(board):
+    return int(board[::-1].translate(_BASE3), 3)
+
+class SolvedTable:
+    # read-only view of a table written by build(), memory-mapped so opening it costs nothing
+
+    def __init__(self, dim, k=None, path=None):
+        self.dim = dim
+        self.k = k or dim
+        path = path or table_path(dim, k)
+        if not os.path.exists(path):
+            raise FileNotFoundError(f'no solved table at {path}, build it with: python3 solved.py -d{dim} -k{self.k}')
+        with open(path, 'rb') as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.data[:4] != MAGIC or self.data[4] != dim or self.data[5] != self.k:
+            raise ValueError(f'{path} is not a solved table for dim={dim}, k={self.k}')
+
+    def value(self, index):
+        return self.data[HEADER + (index >> 2)] >> ((index & 3) << 1) & 3
+
+    def __getitem__(self, board):
+        return self.value(position_index(board))
+
+    def close(self):
+        self.data.close()
+
+# builder: retrograde analysis one layer (number of pieces) at a time, from full boards back to
+# the empty board. each layer is split into chunks that worker processes solve with numpy,
+# reading the finished next layer from a shared-memory array
+
+_shared = {}
+
+def _attach(name, dim, k):
+    import numpy as np
+    from multiprocessing import shared_memory
+    shm = shared_memory.SharedMemory(name=name)
+    _shared['shm'] = shm
+    _shared['values'] = np.ndarray((3**(dim*dim),), dtype=np.uint8, buffer=shm.buf)
+    _shared['lines'] = [list(line_coords) for _, line_coords in win_lines(dim, k)]
+    _shared['pow3'] = 3**np.arange(dim*dim, dtype=np.int64)
+
+def _solve_chunk(args):
+    import numpy as np
+    chunk, x_to_move = args
+    values, lines, pow3 = _shared['values'], _shared['lines'], _shared['pow3']
+    digits = (chunk[:, None] // pow3[None, :]) % 3
+    x_won = np.zeros(len(chunk), dtype=bool)
+    o_won = np.zeros(len(chunk), dtype=bool)
+    for line in lines:
+        x_won |= (digits[:, line] == 1).all(axis=1)
+        o_won |= (digits[:, line] == 2).all(axis=1)
+    out = np.full(len(chunk), DRAW, dtype=np.uint8) #full boards with no winner stay draws
+    # rank children from the mover's point of view: 2 = mover wins, 1 = draw, 0 = mover loses
+    rank_of = np.array([0, 2, 0, 1] if x_to_move else [0, 0, 2, 1], dtype=np.int8)
+    best = np.full(len(chunk), -1, dtype=np.int8)
+    for cell in range(digits.shape[1]):
+        empty = digits[:, cell] == 0
+        if not empty.any():
+            continue
+        child = chunk[empty] + (1 if x_to_move else 2)*pow3[cell]
+        best[empty] = np.maximum(best[empty], rank_of[values[child]])
+    mover, other = (X_WINS, O_WINS) if x_to_move else (O_WINS, X_WINS)
+    out[best == 2] = mover
+    out[best == 0] = other
+    out[x_won] = X_WINS
+    out[o_won] = O_WINS
+    out[x_won & o_won] = UNKNOWN #can't happen in a real game
+    return chunk, out
+
+def _piece_counts(dim):
+    import numpy as np
+    rest = np.arange(3**(dim*dim), dtype=np.int64)
+    xs = np.zeros(len(rest), dtype=np.uint8)
+    os_ = np.zeros(len(rest), dtype=np.uint8)
+    for _ in range(dim*dim):
+        d = rest % 3
+        xs += d == 1
+        os_ += d == 2
+        rest //= 3
+    return xs, os_
+
+def build(dim, k=None, workers=None, path=None, chunk_size=1 << 16):
+    import numpy as np
+    from multiprocessing import shared_memory
+    k = k or dim
+    if dim > 4:
+        raise ValueError('solved tables are only practical up to 4x4')
+    n = dim*dim
+    workers = workers or os.cpu_count()
+    path = path or table_path(dim, k)
+    start = time.time()
+    xs, os_ = _piece_counts(dim)
+    shm = shared_memory.SharedMemory(create=True, size=3**n)
+    try:
+        values = np.ndarray((3**n,), dtype=np.uint8, buffer=shm.buf)
+        values[:] = UNKNOWN
+        with multiprocessing.Pool(workers, initializer=_attach, initargs=(shm.name, dim, k)) as pool:
+            for pieces in range(n, -1, -1):
+                x_to_move = pieces % 2 == 0
+                layer = np.nonzero((xs == (pieces + 1)//2) & (os_ == pieces//2))[0]
+                chunks = [(layer[i:i + chunk_size], x_to_move) for i in range(0, len(layer), chunk_size)]
+                for chunk, out in pool.imap_unordered(_solve_chunk, chunks):
+                    values[chunk] = out
+                print(f'layer {pieces:2d}: {len(layer)} positions ({time.time() - start:.1f}s)')
+        padded = np.zeros(-(-3**n // 4) * 4, dtype=np.uint8)
+        padded[:3**n] = values
+        quads = padded.reshape(-1, 4)
+        packed = quads[:, 0] | quads[:, 1] << 2 | quads[:, 2] << 4 | quads[:, 3] << 6
+        with open(path, 'wb') as f:
+            f.write(MAGIC + bytes([dim, k, 0, 0]))
+            f.write(packed.astype(np.uint8).tobytes())
+        root = ['unknown', 'x wins', 'o wins', 'draw'][int(values[0])]
+        print(f'wrote {path} ({HEADER + len(packed)} bytes), empty board: {root}')
+    finally:
+        del values
+        shm.close()
+        shm.unlink()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build the solved-position table used by the \'solved\' engine.')
+    parser.add_argument('--dim', '-d', type=int, default=3, help='size of board (at most 4)')
+    parser.add_argument('--k', '-k', type=int, default=None, help='number in a row needed to win (default: size of board)')
+    parser.add_argument('--workers', '-w', type=int, default=None, help='number of processes (default: all cores)')
+    args = parser.parse_args()
+    build(args.dim, args.k, args.workers)
@@ -0,0 +1,135 @@
+_symmetries = {}
+
+CHUNK_BITS = 8
+MEMO_SIZE = 1 << 16
+
+class Symmetries:
+    # the 8 symmetries of a square board (rotations and reflections) as permutation tables:
+    # transform t moves the piece on cell i to perms[t][i]. t is a bit set of transpose (4),
+    # flip rows (2) and flip columns (1), so 0 is the identity.
+    # positions are transformed as one int (a | b << dim*dim), CHUNK_BITS at a time through lookup tables
+
+    def __init__(self, dim):
+        self.dim = dim
+        n = self.cells = dim*dim
+        perms = []
+        for t in range(8):
+            perm = []
+            for cell in range(n):
+                y, x = divmod(cell, dim)
+                if t & 4:
+                    y, x = x, y
+                if t & 2:
+                    y = dim - 1 - y
+                if t & 1:
+                    x = dim - 1 - x
+                perm.append(y*dim + x)
+            perms.append(tuple(perm))
+        self.perms = tuple(perms)
+        self.inverse = tuple(tuple(sorted(range(n), key=perm.__getitem__)) for perm in perms)
+        self.tables = [None]
+        for perm in perms[1:]:
+            both = perm + tuple(cell + n for cell in perm)
+            chunks = []
+            for shift in range(0, 2*n, CHUNK_BITS):
+                cells = both[shift:shift + CHUNK_BITS]
+                table = [0]*(1 << len(cells))
+                for bits in range(1, len(table)):
+                    low = bits & -bits
+                    table[bits] = table[bits ^ low] | 1 << cells[low.bit_length() - 1]
+                chunks.append((shift, table))
+            self.tables.append(tuple(chunks))
+
+    def transform(self, a, b, t):
+        if not t:
+            return a, b
+        c, out = a | b << self.cells, 0
+        for shift, table in self.tables[t]:
+            out |= table[c >> shift & (1 << CHUNK_BITS) - 1]
+        return out & (1 << self.cells) - 1, out >> self.cells
+
+    def stabilizer(self, a, b):
+        # the transforms other than the identity that leave the position (a, b) as it is
+        return tuple(t for t in range(1, 8) if self.transform(a, b, t) == (a, b))
+
+    def fixing(self, syms, cell):
+        # the transforms in syms that still hold once a piece goes on cell
+        if not syms:
+            return syms
+        perms = self.perms
+        return tuple(t for t in syms if perms[t][cell] == cell)
+
+    def distinct(self, cells, syms):
+        # one cell from each group of cells the transforms in syms map onto each other, keeping the
+        # order of cells. it's the lowest of the group, so ties broken by cell index land on the same
+        # move. syms has to be closed under composition, which stabilizer() and fixing() results are
+        if not syms:
+            return cells
+        perms = self.perms
+        return [cell for cell in cells if all(perms[t][cell] >= cell for t in syms)]
+
+    def canonical(self, a, b):
+        # (key, t): the smallest of the 8 transformed positions and the transform that gives it
+        n = self.cells
+        mask = (1 << CHUNK_BITS) - 1
+        c = best = a | b << n
+        best_t = 0
+        for t in range(1, 8):
+            out = 0
+            for shift, table in self.tables[t]:
+                out |= table[c >> shift & mask]
+            if out < best:
+                best, best_t = out, t
+        return (best & (1 << n) - 1, best >> n), best_t
+
+def symmetries(dim):
+    # built once per board size
+    if dim not in _symmetries:
+        _symmetries[dim] = Symmetries(dim)
+    return _symmetries[dim]
+
+class SymmetricTable:
+    # wraps a transposition table so it's keyed by canonical position and the symmetric copies of a
+    # position share one entry. best moves are kept in the canonical orientation and mapped back on
+    # the way out. only sound when scores don't change under the symmetries, which holds for line
+    # heuristics that score a line the same as its reverse.
+    # a search probes a position and stores it again once its children are done, so canonical keys
+    # are memoized for a while instead of worked out twice
+
+    def __init__(self, table, dim):
+        self.table = table
+        self.sym = symmetries(dim)
+        self.memo = {}
+
+    def canonical(self, key):
+        found = self.memo.get(key)
+        if found is None:
+            if len(self.memo) >= MEMO_SIZE:
+                self.memo.clear()
+            found = self.memo[key] = self.sym.canonical(*key)
+        return found
+
+    def probe(self, key, depth, alpha=float('-inf'), beta=float('inf')):
+        key, t = self.canonical(key)
+        hit, score, move = self.table.probe(key, depth, alpha, beta)
+        if t and move is not None:
+            move = self.sym.inverse[t][move]
+        return hit, score, move
+
+    def store(self, key, score, depth, bound, move):
+        key, t = self.canonical(key)
+        if t and move is not None:
+            move = self.sym.perms[t][move]
+        self.table.store(key, score, depth, bound, move)
+
+    def clear(self):
+        self.table.clear()
+        self.memo.clear()
+
+    def __getattr__(self, name):
+        if name == 'table': #not set yet while unpickling
+            raise AttributeError(name)
+        return getattr(self.table, name) #hits, probes and the shared table's extras
+
+    def __len__(self):
+        return len(self.table)
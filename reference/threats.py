@@ -0,0 +1,106 @@
+from board_util import win_lines
+import time
+
+class ThreatTimeout(Exception):
+    pass
+
+class ThreatSearch:
+    # forced wins by continuous threats (victory by continuous fours in gomoku terms): the attacker
+    # only plays moves that leave it one move from winning, so the defender's reply is always the
+    # one blocking cell. that keeps the tree narrow enough to follow sequences far past what a
+    # full-width search reaches. a defender block that makes its own threat has to be answered by
+    # the attacker's next move, and two defender threats at once end the sequence.
+    # positions are (attacker, defender) bitboards with the attacker to move
+
+    def __init__(self, dim, k=None):
+        self.dim = dim
+        self.k = k or dim
+        self.masks = [mask for mask, _ in win_lines(dim, self.k)]
+        self.full = (1 << dim*dim) - 1
+        self.nodes = 0
+        self.deadline = None
+        self.failed = set() #positions already shown to have no forced win
+
+    def winning_cells(self, att, dfn):
+        # empty cells that would complete a line for att
+        cells = set()
+        for mask in self.masks:
+            if dfn & mask:
+                continue
+            gap = mask & ~att
+            if gap and not gap & (gap - 1):
+                cells.add(gap.bit_length() - 1)
+        return cells
+
+    def threat_moves(self, att, dfn):
+        # cell -> cells it would leave att one move from winning on, for every empty cell that makes a threat
+        threats = {}
+        for mask in self.masks:
+            if dfn & mask:
+                continue
+            gap = mask & ~att
+            rest = gap & (gap - 1)
+            if gap and rest and not rest & (rest - 1): #two empty cells
+                a, b = (gap ^ rest).bit_length() - 1, rest.bit_length() - 1
+                threats.setdefault(a, set()).add(b)
+                threats.setdefault(b, set()).add(a)
+        return threats
+
+    def forced_win(self, att, dfn, deadline=None):
+        # the winning sequence of cells (attacker, defender, ..., attacker's winning move), or None
+        # if there isn't one or the deadline passed before it was found
+        self.deadline = deadline
+        try:
+            return self.search(att, dfn)
+        except ThreatTimeout:
+            return None
+        finally:
+            self.deadline = None
+
+    def search(self, att, dfn):
+        self.nodes += 1
+        if self.deadline is not None and self.nodes & 63 == 0 and time.time() > self.deadline:
+            raise ThreatTimeout()
+        wins = self.winning_cells(att, dfn)
+        if wins:
+            return [min(wins)]
+        if (att, dfn) in self.failed:
+            return None
+        blocks = self.winning_cells(dfn, att)
+        threats = self.threat_moves(att, dfn)
+        if len(blocks) > 1:
+            threats = {}
+        elif blocks: #our move has to block the defender's threat as well
+            threats = {cell: replies for cell, replies in threats.items() if cell in blocks}
+        # double threats first, they win on the spot
+        for cell, replies in sorted(threats.items(), key=lambda p: -len(p[1])):
+            if len(replies) > 1:
+                return [cell, min(replies), min(replies - {min(replies)})]
+            reply = next(iter(replies))
+            line = self.search(att | 1 << cell, dfn | 1 << reply)
+            if line is not None:
+                return [cell, reply] + line
+        if len(self.failed) > 1 << 18:
+            self.failed.clear()
+        self.failed.add((att, dfn))
+        return None
+
+    def defenses(self, me, opp, deadline=None):
+        # with me to move: None if the opponent has no forced win even with a free move, otherwise
+        # the cells that leave them without one. an empty list is a forced loss as far as threats go,
+        # None is also returned when the deadline passes before every cell has been tried
+        if self.forced_win(opp, me, deadline) is None:
+            return None
+        safe = []
+        empty = ~(me | opp) & self.full
+        for cell in range(self.dim*self.dim):
+            if empty >> cell & 1:
+                self.deadline = deadline
+                try:
+                    if self.search(opp, me | 1 << cell) is None:
+                        safe.append(cell)
+                except ThreatTimeout:
+                    return None
+                finally:
+                    self.deadline = None
+        return safe
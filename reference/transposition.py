@@ -0,0 +1,48 @@
+import sys
+
+EXACT, LOWER, UPPER = 0, 1, 2
+
+# rough per-entry cost: dict slot + board key + entry tuple + move string
+ENTRY_BYTES = 96 + 2*sys.getsizeof('') + sys.getsizeof((0, 0, 0, None))
+
+class TranspositionTable:
+    # bounded map of position -> (score, depth, bound, best_move)
+    # replacement: a stored position is only overwritten by an equal or deeper search;
+    # once the memory cap is hit the oldest entries are evicted first
+
+    def __init__(self, max_mb=64):
+        self.max_entries = max(1, int(max_mb * 2**20) // ENTRY_BYTES)
+        self.table = {}
+        self.hits = 0
+        self.probes = 0
+
+    def probe(self, key, depth, alpha=float('-inf'), beta=float('inf')):
+        # returns (hit, score, move); move is worth trying first even when the score can't be used
+        self.probes += 1
+        entry = self.table.get(key)
+        if entry is None:
+            return False, None, None
+        score, entry_depth, bound, move = entry
+        if entry_depth >= depth:
+            if bound == EXACT or (bound == LOWER and score >= beta) or (bound == UPPER and score <= alpha):
+                self.hits += 1
+                return True, score, move
+        return False, None, move
+
+    def store(self, key, score, depth, bound, move):
+        table = self.table
+        old = table.get(key)
+        if old is not None:
+            if old[1] > depth:
+                return
+            del table[key] #re-insert so it counts as fresh for eviction
+        elif len(table) >= self.max_entries:
+            del table[next(iter(table))]
+        table[key] = (score, depth, bound, move)
+
+    def clear(self):
+        self.table.clear()
+        self.hits = self.probes = 0
+
+    def __len__(self):
+        return len(self.table)
@@ -1,153 +1,251 @@
-from board_util import check_win_coords, check_tie, board_str, Color
-from engines import available_engines
-from itertools import cycle, repeat
+from board_util import check_win_after_coords, check_tie, Color, renderers, AnsiRenderer, PlainRenderer, utf8_stdout
+from registry import available_engines
+from records import make_record, append_record
+from itertools import cycle
+from collections import namedtuple
 import time
 import argparse
 import multiprocessing
+import os
 import sys
 
-def step(engine, board, time_remaining, queue):
-    queue.put(engine.get_move_wrapper(board))
-
-def timer_f(engine, time_remaining, delta=1):
-    t = time_remaining
-    while t > 0:
-        print(f'time remaining: {t:.1f}s')
-        time.sleep(delta)
-        t -= delta
-
-def play_human(engine1, engine2, dim=3, delay=True, time_limit=30):
-    engines = [available_engines[engine1](piece='x', dim=dim), available_engines[engine2](piece='o', dim=dim)]
-    print(f'\n{dim}x{dim} tictactoe game: {engines[0]} against {engines[1]}\n\n')
-    print('Note: this mode will not kill the AI player if it takes too long.')
+# winner is the index of the winning player (-1 for a draw),
+# reason is one of 'win', 'draw', 'timeout' or 'exception',
+# stats holds each player's list of per-move search stats (see Engine.search_stats),
+# moves the cells played in order and think the clock time each of them took
+GameResult = namedtuple('GameResult', ['winner', 'reason', 'stats', 'moves', 'think'], defaults=[None, None, None])
+
+def default_renderer():
+    # colours only when they'll be seen on a terminal
+    return AnsiRenderer() if sys.stdout.isatty() else PlainRenderer()
+
+def make_engines(engine1, engine2, dim, k, profile_dir=None, verbose=True):
+    engines = [available_engines[engine1](piece='x', dim=dim, k=k), available_engines[engine2](piece='o', dim=dim, k=k)]
+    for engine in engines:
+        engine.verbose = verbose
+    if profile_dir is not None:
+        os.makedirs(profile_dir, exist_ok=True)
+        for engine in engines:
+            engine.profile_dir = profile_dir
+    return engines
+
+def engine_worker(engine, conn, ponder=False):
+    # one process per engine for the whole game, so anything the engine caches survives between moves.
+    # with ponder the engine keeps thinking after its move until the next request comes in
+    utf8_stdout() #engines print the board when they raise
+    try:
+        while True:
+            try:
+                request = conn.recv()
+            except EOFError: #the game process went away
+                return
+            if request is None:
+                return
+            board, time_remaining = request
+            response = engine.get_move_wrapper(board, time_remaining)
+            conn.send(response)
+            success, move, _ = response
+            if ponder and success:
+                try:
+                    engine.ponder(move, conn.poll)
+                except Exception:
+                    import traceback
+                    traceback.print_exc() #pondering is only a head start, the engine can still move
+    finally:
+        engine.close()
+
+def start_worker(engine, ponder=False):
+    conn, worker_conn = multiprocessing.Pipe()
+    worker = multiprocessing.Process(target=engine_worker, args=(engine, worker_conn, ponder)) #not a daemon, so engines can start their own processes
+    worker.start()
+    return worker, conn
+
+def stop_workers(workers):
+    for worker, conn in workers.values():
+        if worker.is_alive():
+            try:
+                conn.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+            worker.join(1)
+            if worker.is_alive():
+                worker.kill()
+
+def wait_for_move(conn, time_remaining, renderer, delta=1):
+    # shows the countdown while polling the pipe, returns None if the clock runs out.
+    # headless games have no countdown to show, so they wait on the pipe once for the whole clock
+    if renderer.headless:
+        return conn.recv() if conn.poll(max(time_remaining, 0)) else None
+    deadline = time.time() + time_remaining
+    while True:
+        t = deadline - time.time()
+        if t <= 0:
+            return None
+        renderer.countdown(t)
+        if conn.poll(min(delta, t)):
+            return conn.recv()
+
+def play_human(engine1, engine2, dim=3, delay=True, time_limit=30, k=None, profile_dir=None, ponder=False, renderer=None):
+    renderer = renderer or default_renderer()
+    k = k or dim
+    engines = make_engines(engine1, engine2, dim, k, profile_dir, not renderer.headless)
+    renderer.message('\n{}x{} tictactoe game ({} in a row): {} against {}\n\n', dim, dim, k, *engines)
     times = {engines[0]: time_limit, engines[1]: time_limit}
     board = '-'*dim*dim
-
+    workers = {engine: start_worker(engine, ponder) for engine in engines if engine.engine_name != 'human'}
+    try:
+        return play_human_moves(engines, workers, times, board, dim, delay, k, renderer)
+    finally:
+        stop_workers(workers)
+
+def play_human_moves(engines, workers, times, board, dim, delay, k, renderer):
+    # like play_moves, but humans move in this process and aren't held to their clock.
+    # their think time is still recorded
+    stats = ([], [])
+    moves, think = [], []
     for i, engine in enumerate(cycle(engines)):
         if delay:
             time.sleep(0.8)
-        print(f'move {i}: waiting for {engine}\'s move...')
+        renderer.message('move {}: waiting for {}\'s move...', i, engine)
 
-        if engine.engine_name != 'human': #timing stuff
-            timer = multiprocessing.Process(target=timer_f, args=(engine, times[engine]))
-            timer.start()
-            start = time.time()
-
-        success, result = engine.get_move_wrapper(board)
-
-        if engine.engine_name != 'human': #timing stuff
-            timer.kill()
+        start = time.time()
+        if engine in workers: #timing stuff
+            worker, conn = workers[engine]
+            conn.send((board, times[engine]))
+            response = wait_for_move(conn, times[engine], renderer)
             times[engine] -= time.time() - start
-            if times[engine] < 0: #timeout condition
-                print(f'{engine} ran out of time and loses by forfeit!')
+            if response is None: #timeout condition
+                worker.kill()
+                renderer.message('{} ran out of time and loses by forfeit!', engine)
                 other_index = 1 - engines.index(engine)
-                print(f'P{other_index+1} WIN: {engines[other_index]} wins!')
-                return
+                renderer.message('P{} WIN: {} wins!', other_index+1, engines[other_index])
+                return GameResult(other_index, 'timeout', stats, moves, think)
+            success, result, move_stats = response
+            renderer.stats(move_stats)
+        else:
+            success, result, move_stats = engine.get_move_wrapper(board, times[engine])
+        elapsed = time.time() - start
+        stats[engines.index(engine)].append(move_stats)
 
         if success:
             newboard = result
         else:
-            print(f'{engine} forfeits due to an exception (printed above).')
+            renderer.message('{} forfeits due to an exception (printed above).', engine)
             other_index = 1 - engines.index(engine)
-            print(f'P{other_index+1} WIN: {engines[other_index]} wins!')
-            return
+            renderer.message('P{} WIN: {} wins!', other_index+1, engines[other_index])
+            return GameResult(other_index, 'exception', stats, moves, think)
 
         highlight_index = [i for i in range(len(newboard)) if newboard[i] != board[i]][0]
         board = newboard
-        print('move made:')
-        print(board_str(board, dim=dim, highlight=(highlight_index,), hi_color=Color.CYAN))
-        victory, line_coords = check_win_coords(board, dim)
+        moves.append(highlight_index)
+        think.append(elapsed)
+        renderer.message('move made:')
+        renderer.board(board, dim, (highlight_index,), Color.CYAN)
+        victory, line_coords = check_win_after_coords(board, highlight_index, dim, k)
         if victory:
-            print(board_str(board, dim=dim, highlight=line_coords, hi_color=Color.GREEN))
-            print(f'P{engines.index(engine)+1} WIN: {engine} wins!')
-            return
+            renderer.board(board, dim, line_coords, Color.GREEN)
+            renderer.message('P{} WIN: {} wins!', engines.index(engine)+1, engine)
+            return GameResult(engines.index(engine), 'win', stats, moves, think)
         elif check_tie(board):
-            print('DRAW: game ends in a draw')
-            return
-
-def play_worker(args):
-    i, args = args
-    print(f'worker {i} dispatched')
-    print(args)
-    return play(*args)
+            renderer.message('DRAW: game ends in a draw')
+            return GameResult(-1, 'draw', stats, moves, think)
 
-def play(engine1, engine2, dim=3, delay=True, time_limit=30, stdout=None):
+def play(engine1, engine2, dim=3, delay=True, time_limit=30, k=None, stdout=None, profile_dir=None, ponder=False, log=None,
+         renderer=None):
+    # log: file to append the game record to (see records.py)
+    # renderer: board_util renderer for the game's output, NullRenderer for a headless game
     if stdout is not None:
         sys.stdout = stdout
+    renderer = renderer or default_renderer()
 
+    k = k or dim
     if 'human' in (engine1, engine2):
-        return play_human(engine1, engine2, dim, delay, time_limit)
-
-    engines = [available_engines[engine1](piece='x', dim=dim), available_engines[engine2](piece='o', dim=dim)]
-    print(f'\n{dim}x{dim} tictactoe game: {engines[0]} against {engines[1]}\n\n')
-    times = {engines[0]: time_limit, engines[1]: time_limit}
-    board = '-'*dim*dim
-
-
+        result = play_human(engine1, engine2, dim, delay, time_limit, k, profile_dir, ponder, renderer)
+    else:
+        engines = make_engines(engine1, engine2, dim, k, profile_dir, not renderer.headless)
+        renderer.message('\n{}x{} tictactoe game ({} in a row): {} against {}\n\n', dim, dim, k, *engines)
+        times = {engines[0]: time_limit, engines[1]: time_limit}
+        board = '-'*dim*dim
+        workers = {engine: start_worker(engine, ponder) for engine in engines}
+        try:
+            result = play_moves(engines, workers, times, board, dim, delay, k, renderer)
+        finally:
+            stop_workers(workers)
+    if log is not None:
+        append_record(log, make_record(engine1, engine2, dim, k, time_limit, result))
+    return result
+
+def play_moves(engines, workers, times, board, dim, delay, k, renderer):
+    stats = ([], [])
+    moves, think = [], []
     for i, engine in enumerate(cycle(engines)):
         if delay:
             time.sleep(0.8)
-        print(f'move {i}: waiting for {engine}\'s move...')
+        renderer.message('move {}: waiting for {}\'s move...', i, engine)
 
-        queue = multiprocessing.Queue()
-        p = multiprocessing.Process(target=step, args=(engine, board, times[engine], queue))
-        timer = multiprocessing.Process(target=timer_f, args=(engine, times[engine]))
-        p.start()
-        timer.start()
+        worker, conn = workers[engine]
+        conn.send((board, times[engine]))
         start = time.time()
-        p.join(times[engine])
-        timer.kill()
-        times[engine] -= time.time() - start
+        response = wait_for_move(conn, times[engine], renderer)
+        elapsed = time.time() - start
+        times[engine] -= elapsed
 
-        if p.is_alive(): #timeout condition
-            p.kill()
-            print(f'{engine} ran out of time and loses by forfeit!')
+        if response is None: #timeout condition
+            worker.kill()
+            renderer.message('{} ran out of time and loses by forfeit!', engine)
             other_index = 1 - engines.index(engine)
-            print(f'P{engines.index(engine)+1} TIMEOUT: {engines[other_index]} wins!')
-            return other_index, True
+            renderer.message('P{} TIMEOUT: {} wins!', engines.index(engine)+1, engines[other_index])
+            return GameResult(other_index, 'timeout', stats, moves, think)
 
-        success, result = queue.get()
+        success, result, move_stats = response
+        stats[engines.index(engine)].append(move_stats)
+        renderer.stats(move_stats)
         if success:
             newboard = result
         else:
-            print(f'{engine} forfeits due to an exception (printed above).')
+            renderer.message('{} forfeits due to an exception (printed above).', engine)
             other_index = 1 - engines.index(engine)
-            print(f'P{engines.index(engine)+1} EXCEPTION: {engines[other_index]} wins!')
-            return other_index, True
+            renderer.message('P{} EXCEPTION: {} wins!', engines.index(engine)+1, engines[other_index])
+            return GameResult(other_index, 'exception', stats, moves, think)
 
         highlight_index = [i for i in range(len(newboard)) if newboard[i] != board[i]][0]
         board = newboard
-        print('move made:')
-        print(board_str(board, dim=dim, highlight=(highlight_index,), hi_color=Color.CYAN))
-        victory, line_coords = check_win_coords(board, dim)
+        moves.append(highlight_index)
+        think.append(elapsed)
+        renderer.message('move made:')
+        renderer.board(board, dim, (highlight_index,), Color.CYAN)
+        victory, line_coords = check_win_after_coords(board, highlight_index, dim, k)
         if victory:
-            print(board_str(board, dim=dim, highlight=line_coords, hi_color=Color.GREEN))
-            print(f'P{engines.index(engine)+1} WIN: {engine} wins!')
-            return engines.index(engine), False
+            renderer.board(board, dim, line_coords, Color.GREEN)
+            renderer.message('P{} WIN: {} wins!', engines.index(engine)+1, engine)
+            return GameResult(engines.index(engine), 'win', stats, moves, think)
         elif check_tie(board):
-            print('DRAW: game ends in a draw')
-            return -1, False
-
-def score(runs, workers, engine1, engine2, dim=3, delay=True, time_limit=30):
-    pool = multiprocessing.Pool(processes = workers)
-    print(f'running {runs*workers} games, {dim}x{dim}, P1: {engine1}, P2: {engine2}, time {time_limit}')
-    print('dispatching workers...')
-    args = (engine1, engine2, dim, delay, time_limit)
-    print(list(zip(range(workers), repeat(args))))
-    returns = pool.map(play_worker, zip(range(workers), repeat(args)))
-    p1_wins = returns.count((0, False))
-    p2_wins = returns.count((1, False))
-    draws = returns.count((-1, False))
-    p1_timeouts = returns.count((0, True))
-    p2_timeouts = returns.count((1, True))
-    print(p1_wins, p2_wins, draws, p1_timeouts, p2_timeouts)
+            renderer.message('DRAW: game ends in a draw')
+            return GameResult(-1, 'draw', stats, moves, think)
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Play tic-tac-toe (noughts and crosses) with human or computer agents.')
-    parser.add_argument('engine1', type=str, choices=available_engines, help='engine for player 1')
-    parser.add_argument('engine2', type=str, choices=available_engines, help='engine for player 2')
+    # a metavar keeps argparse from listing (and so looking for plugin) engines unless help is shown
+    parser.add_argument('engine1', type=str, choices=available_engines, metavar='engine1', help='engine for player 1 (%(choices)s)')
+    parser.add_argument('engine2', type=str, choices=available_engines, metavar='engine2', help='engine for player 2 (%(choices)s)')
     parser.add_argument('--dim', '-d', type=int, default=3, help='size of board')
     parser.add_argument('--time', '-t', type=float, default=30, help='each player\'s time limit')
+    parser.add_argument('--k', '-k', type=int, default=None, help='number in a row needed to win (default: size of board)')
     parser.add_argument('--sleep', action='store_true', help='add sleep between moves (not counted against engine clocks)')
+    parser.add_argument('--profile', type=str, default=None, metavar='DIR', help='run every engine move under cProfile and write the profiles to DIR')
+    parser.add_argument('--ponder', action='store_true', help='let engines keep searching on the opponent\'s time (needs a spare core each to be fair)')
+    parser.add_argument('--log', type=str, default=None, help='append a record of the game to this JSONL file')
+    parser.add_argument('--render', type=str, choices=renderers, default=None, help='game output: ansi colours, plain text or none (default: ansi on a terminal, otherwise plain)')
     args = parser.parse_args()
-    play(args.engine1, args.engine2, args.dim, args.sleep, args.time)
\ No newline at end of file
+    if args.k is not None and not 1 <= args.k <= args.dim:
+        parser.error('k must be between 1 and the size of the board')
+    renderer = renderers[args.render]() if args.render else default_renderer()
+    result = play(args.engine1, args.engine2, args.dim, args.sleep, args.time, args.k, profile_dir=args.profile, ponder=args.ponder,
+                  log=args.log, renderer=renderer)
+    if renderer.headless: #nothing else was printed, still say how it ended
+        if result.winner == -1:
+            print(f'draw after {len(result.moves)} moves')
+        else:
+            winner = (args.engine1, args.engine2)[result.winner]
+            how = {'win': '', 'timeout': ', the other side ran out of time', 'exception': ', the other side raised'}[result.reason]
+            print(f'P{result.winner+1} ({winner}) wins after {len(result.moves)} moves{how}')
\ No newline at end of file
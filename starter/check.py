@@ -1,25 +1,98 @@
-from engines import available_engines
-import subprocess
+from registry import available_engines
+from ttt import play
+from board_util import NullRenderer
 import multiprocessing
 import argparse
-from itertools import repeat
+import os
+import queue
 
-def worker(args):
-    i, (cmd, *args) = args
-    print(f'worker {i} dispatched')
-    # print(args)
-    
-    result = subprocess.check_output(cmd, stderr=subprocess.DEVNULL).decode('utf-8').splitlines()
-    print(f'worker {i} result: ', result[-1])
-    # print()
-    return result[-1][:4]
+class GameFailed(Exception):
+    # a game that raised outside the engines' moves (an engine that can't be made, an unwritable log),
+    # carrying the worker's traceback as text since the exception itself may not pickle
+    pass
 
-def score(runs, workers, engine1, engine2, dim=3, delay=True, time_limit=30):
-    pool = multiprocessing.Pool(processes = workers)
-    cmd = ['python3', 'ttt.py', engine1, engine2, f'-d{dim}', f'-t{time_limit}']
-    if delay:
-        cmd.append('--sleep')
+def game_worker(tasks, results):
+    # long-lived worker: plays games from the task queue until it gets None
+    # games are headless, only the results come back. stdout still goes nowhere for anything engines print on errors
+    devnull = open(os.devnull, 'w')
+    while True:
+        task = tasks.get()
+        if task is None:
+            return
+        i, kwargs = task
+        try:
+            result = play(**kwargs, stdout=devnull, renderer=NullRenderer())
+        except Exception:
+            import traceback
+            result = GameFailed(traceback.format_exc())
+        results.put((i, result))
 
+def next_result(results, procs, poll=1):
+    # (task id, GameResult or GameFailed) from the workers. raises GameFailed if a worker
+    # dies without answering, instead of waiting on the queue forever
+    while True:
+        try:
+            return results.get(timeout=poll)
+        except queue.Empty:
+            for p in procs:
+                if p.exitcode not in (None, 0):
+                    raise GameFailed(f'game worker {p.pid} died with exit code {p.exitcode}')
+
+def result_key(result):
+    if result.reason == 'draw':
+        return 'DRAW'
+    if result.reason == 'win':
+        return f'P{result.winner+1} W'
+    return f'P{2-result.winner} {result.reason[0].upper()}' #the loser timed out / raised
+
+def stats_summary(games, player):
+    # per-move averages of one player's search stats over all the games
+    moves = [stats for game in games if game.stats for stats in game.stats[player]]
+    if not moves:
+        return 'no moves'
+    n = len(moves)
+    total = lambda key: sum(stats[key] for stats in moves)
+    deep = [stats for stats in moves if stats['depth']]
+    out = (f"{n} moves, {total('nodes')/n:.0f} nodes, {total('leaves')/n:.0f} leaves, {total('cutoffs')/n:.0f} cutoffs, "
+           f"{total('tt_hits')/n:.0f} tt hits")
+    if deep:
+        out += (f", depth {sum(s['depth'] for s in deep)/len(deep):.1f}, "
+                f"ebf {sum(s['ebf'] for s in deep)/len(deep):.2f}")
+    time_used = total('time')
+    if time_used > 0:
+        out += f", {total('nodes')/time_used:.0f} nodes/s"
+    return out + f", {time_used/n:.2f}s/move (max {max(stats['time'] for stats in moves):.2f}s)"
+
+def run_games(games, workers, kwargs, on_result=None):
+    # schedule games over a work queue so a slow game never holds up the others. kwargs go to ttt.play
+    tasks = multiprocessing.Queue()
+    results = multiprocessing.Queue()
+    for i in range(games):
+        tasks.put((i, kwargs))
+    for _ in range(workers):
+        tasks.put(None)
+    procs = [multiprocessing.Process(target=game_worker, args=(tasks, results)) for _ in range(min(workers, games))]
+    for p in procs:
+        p.start()
+    returns = []
+    try:
+        for _ in range(games):
+            i, result = next_result(results, procs)
+            if isinstance(result, GameFailed):
+                raise GameFailed(f'game {i} failed:\n{result}')
+            returns.append(result)
+            if on_result is not None:
+                on_result(i, result)
+    except BaseException:
+        for p in procs: #the queued games would only fail the same way
+            p.terminate()
+        raise
+    for p in procs:
+        p.join()
+    return returns
+
+def score(runs, workers, engine1, engine2, dim=3, delay=True, time_limit=30, k=None, ponder=False, log=None):
+    k = k or dim
     total = runs * workers
     results = {
         'P1 W': 0,
@@ -31,15 +104,15 @@ def score(runs, workers, engine1, engine2, dim=3, delay=True, time_limit=30):
         'P2 E': 0,
     }
 
-    print(f'running {runs*workers} games, {dim}x{dim}, P1: {engine1}, P2: {engine2}, time {time_limit}')
-    args = (cmd, engine1, engine2, dim, delay, time_limit)
-    for i in range(runs):
-        print()
-        print(f'dispatching workers for run {i+1}/{runs}')
-        # print(list(zip(range(workers), repeat(args))))
-        returns = pool.map(worker, zip(range(workers), repeat(args)))
-        for r in returns:
-            results[r] += 1
+    def on_result(i, result):
+        results[result_key(result)] += 1
+        done = sum(results.values())
+        counts = '  '.join(f'{k}: {v:03d}' for k, v in results.items())
+        print(f'\r[{done:03d}/{total:03d}] {counts}', end='\n' if done == total else '', flush=True)
+
+    print(f'running {runs*workers} games, {dim}x{dim}, {k} in a row, P1: {engine1}, P2: {engine2}, time {time_limit}')
+    games = run_games(total, workers, dict(engine1=engine1, engine2=engine2, dim=dim, delay=delay, time_limit=time_limit,
+                                           k=k, ponder=ponder, log=log), on_result)
 
     p1_wins = results['P1 W']
     p2_wins = results['P2 W']
@@ -49,7 +122,7 @@ def score(runs, workers, engine1, engine2, dim=3, delay=True, time_limit=30):
     p1_exceptions = results['P1 E']
     p2_exceptions = results['P2 E']
     print()
-    print(f'=== P1: {engine1} vs P2: {engine2} | dim={dim}x{dim}, time_limit={time_limit} | {runs*workers} TOTAL RUNS ===')
+    print(f'=== P1: {engine1} vs P2: {engine2} | dim={dim}x{dim}, k={k}, time_limit={time_limit} | {runs*workers} TOTAL RUNS ===')
     print('== WINS ==')
     print(f'P1: {p1_wins:03d} ({100*p1_wins/total:05.1f}%)       P2: {p2_wins:03d} ({100*p2_wins/total:05.1f}%)')
     print(f'== DRAWS: {draws:03d} ==')
@@ -57,15 +130,23 @@ def score(runs, workers, engine1, engine2, dim=3, delay=True, time_limit=30):
     print(f'P1: {p1_timeouts:03d}                P2: {p2_timeouts:03d}')
     print(f'== EXCEPTIONS ==')
     print(f'P1: {p1_exceptions:03d}                P2: {p2_exceptions:03d}')
+    print(f'== SEARCH STATS (per move) ==')
+    print(f'P1: {stats_summary(games, 0)}')
+    print(f'P2: {stats_summary(games, 1)}')
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Run multiple games of tic-tac-toe with human or computer agents and see stats.')
-    parser.add_argument('engine1', type=str, choices=available_engines, help='engine for player 1')
-    parser.add_argument('engine2', type=str, choices=available_engines, help='engine for player 2')
+    parser.add_argument('engine1', type=str, choices=available_engines, metavar='engine1', help='engine for player 1 (%(choices)s)')
+    parser.add_argument('engine2', type=str, choices=available_engines, metavar='engine2', help='engine for player 2 (%(choices)s)')
     parser.add_argument('--dim', '-d', type=int, default=3, help='size of board')
     parser.add_argument('--time', '-t', type=float, default=30, help='each player\'s time limit')
+    parser.add_argument('--k', '-k', type=int, default=None, help='number in a row needed to win (default: size of board)')
     parser.add_argument('--sleep', action='store_true', help='add sleep between moves (not counted against engine clocks)')
     parser.add_argument('--runs', '-r', type=int, default=16, help='number of times to run games')
     parser.add_argument('--workers', '-w', type=int, default=16, help='number of games to run in parallel')
+    parser.add_argument('--ponder', action='store_true', help='let engines keep searching on the opponent\'s time')
+    parser.add_argument('--log', type=str, default=None, help='append a record of every game to this JSONL file (summarize it with records.py)')
     args = parser.parse_args()
-    score(args.runs, args.workers, args.engine1, args.engine2, args.dim, args.sleep, args.time)
+    if args.k is not None and not 1 <= args.k <= args.dim:
+        parser.error('k must be between 1 and the size of the board')
+    score(args.runs, args.workers, args.engine1, args.engine2, args.dim, args.sleep, args.time, args.k, args.ponder, args.log)
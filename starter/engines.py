@@ -1,39 +1,101 @@
 from itertools import cycle, chain
-from board_util import check_win, check_tie, board_str, lines, Color
+from board_util import check_win, check_win_after, check_tie, board_str, lines, colors
+import os
 import random
 import time
-import traceback
 
 class Engine:
 
     engine_name = 'base tictactoe engine'
+    default_time = 30 #assumed clock when get_move is called without time_remaining
+    safety_margin = 0.5 #seconds kept back for process/harness overhead
+    moves_per_k = 4 #expected moves each player still makes, per cell of k in a row
 
-    def __init__(self, piece, dim):
+    def __init__(self, piece, dim, k=None):
         self.piece = piece
         self.enemy = 'x' if piece == 'o' else 'o'
         self.dim = dim
+        self.k = k or dim #number in a row needed to win
+        self.time_remaining = None #seconds left on this engine's clock, set before each get_move
+        self.moves_checked = 0 #positions searched for the last move
+        self.leaves = 0 #positions scored without searching further (heuristic or finished game)
+        self.cutoffs = 0 #moves skipped by pruning
+        self.profile_dir = None #set to a directory to dump a cProfile of every move there
+        self.verbose = True #per-move reports, turned off for headless games
         
-    def get_move_wrapper(self, board, *args, **kwargs): #don't worry about this too much
+    def get_move_wrapper(self, board, time_remaining=None, *args, **kwargs): #don't worry about this too much
+        # returns (success, move or exception, search stats)
+        self.time_remaining = time_remaining
+        self.moves_checked = self.leaves = self.cutoffs = 0
+        tt = getattr(self, 'tt', None)
+        tt_hits = tt.hits if tt is not None else 0
+        start = time.time()
         try:
-            return True, self.get_move(board, *args, **kwargs)
+            if self.profile_dir is None:
+                move = self.get_move(board, *args, **kwargs)
+            else:
+                move = self.profiled_move(board, *args, **kwargs)
         except Exception as e:
-            print(f'\n{Color.RED}ERROR: exception in {self}{Color.RESET}\n')
+            import traceback
+            color = colors()
+            print(f'\n{color.RED}ERROR: exception in {self}{color.RESET}\n')
             print('board state during exception:')
             print(board_str(board))
             traceback.print_exc()
             print()
-            return False, e
+            return False, e, self.search_stats(time.time() - start, 0)
+        return True, move, self.search_stats(time.time() - start, tt.hits - tt_hits if tt is not None else 0)
+
+    def profiled_move(self, board, *args, **kwargs):
+        # one profile file per move, named after the engine class, piece and move number
+        import cProfile
+        profile = cProfile.Profile()
+        try:
+            return profile.runcall(self.get_move, board, *args, **kwargs)
+        finally:
+            move_number = self.dim*self.dim - board.count('-')
+            profile.dump_stats(os.path.join(self.profile_dir, f'{type(self).__name__}_{self.piece}_{move_number:03d}.prof'))
+
+    def search_stats(self, elapsed, tt_hits):
+        # plain dict so it can go back over the worker pipe. engines that don't deepen report depth 0
+        depth = getattr(self, 'depth_reached', 0)
+        depth_times = getattr(self, 'depth_times', [])
+        nodes = self.moves_checked
+        return {
+            'nodes': nodes,
+            'leaves': self.leaves,
+            'cutoffs': self.cutoffs,
+            'tt_hits': tt_hits,
+            'depth': depth,
+            'ebf': nodes ** (1/depth) if depth and nodes else 0, #effective branching factor
+            'ply_times': [t - prev for prev, t in zip([0] + depth_times, depth_times)],
+            'time': elapsed,
+        }
 
     def get_move(self, board):
         raise NotImplementedError('You need to implement get_move')
 
+    def close(self):
+        pass #called once the game is over, for engines holding processes or files
+
+    def ponder(self, board, stop):
+        pass #called with the board after our move, may think on the opponent's time until stop() is true
+
+    def time_budget(self, board):
+        # share what's left of the clock evenly over our remaining moves: one per pair of empty cells,
+        # but no more than a game to k in a row usually lasts, with k < dim it ends long before the board fills
+        time_remaining = self.default_time if self.time_remaining is None else self.time_remaining
+        time_remaining = max(time_remaining - self.safety_margin, 0.01)
+        moves_left = min((board.count('-') + 1)//2, self.moves_per_k*self.k)
+        return time_remaining/max(moves_left, 1), time_remaining
+
     def possible_moves(self, board, piece):
         for i, space in enumerate(board):
             if space in '- ':
                 yield board[:i] + piece + board[i+1:]
 
     def __hash__(self):
-        return hash((type(self).__name__, self.piece, self.enemy, self.dim))
+        return hash((type(self).__name__, self.piece, self.enemy, self.dim, self.k))
 
     def __str__(self):
         return f'<{self.engine_name} [{self.piece}]>'
@@ -44,7 +106,8 @@ class RandomEngine(Engine):
 
     def get_move(self, board):
         # raise Exception('testing exceptions')
-        print('beep boop randomizing move...')
+        if self.verbose:
+            print('beep boop randomizing move...')
         b = list(board)
         choices = [i for i, pc in enumerate(board) if pc == '-']
         b[random.choice(choices)] = self.piece
@@ -68,16 +131,14 @@ class HumanEngine(Engine):
         print('\n'.join(out))
         # ok = False
         while True:
-            inp = input(f'Please enter a coordinate pair to place \'{self.piece}\' (such as B2 or 1A): ')
-            if len(inp) != 2:
-                print('A coordinate pair must be two characters.')
-                continue
-            sorted_ = sorted(list(inp)) #sort based on ascii values to allow both orderings as input
-            if not(sorted_[0].isdigit() and sorted_[1].isalpha()):
-                print('Please include one letter and one digit.')
+            inp = input(f'Please enter a coordinate pair to place \'{self.piece}\' (such as B2 or 1A): ').strip()
+            letters = [c for c in inp if c.isalpha()]
+            digits = ''.join(c for c in inp if c.isdigit()) #any number of digits so boards wider than 9 work
+            if len(letters) != 1 or not digits or len(letters) + len(digits) != len(inp):
+                print('Please include one letter and one number.')
                 continue
-            x = int(sorted_[0]) - 1
-            y = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'.index(sorted_[1].upper())
+            x = int(digits) - 1
+            y = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'.index(letters[0].upper())
             if not (0 <= x < self.dim and 0 <= y < self.dim):
                 print('That cell is not in the grid.')
                 continue
@@ -102,26 +163,23 @@ class GreedyEngine(Engine):
     engine_name = 'greedy'
 
     def get_move(self, board):
-        moves = list(self.possible_moves(board, self.piece))
-        move_scores = {move: self.heuristic(move) for move in moves}
+        move_cells = {board[:i] + self.piece + board[i+1:]: i for i, space in enumerate(board) if space == '-'}
+        move_scores = {move: self.heuristic(move, cell) for move, cell in move_cells.items()}
+        self.moves_checked = self.leaves = len(move_scores)
+        moves = list(move_cells)
         random.shuffle(moves)
         move = max(moves, key=lambda m: move_scores[m])
         return move
     
-    def heuristic(self, board):
+    def heuristic(self, board, cell=None):
         p, _ = self.piece, self.enemy
         h = 0
-        if check_win(board, self.dim) == self.piece:
+        winner = check_win(board, self.dim, k=self.k) if cell is None else check_win_after(board, cell, self.dim, self.k)
+        if winner == self.piece:
             return float('inf')
-        for line in lines(board, self.dim):
+        for line in lines(board, self.dim, k=self.k):
             if p+p in line:
                 h += 1
         return h
 
-available_engines = {
-    'random': RandomEngine,
-    'minimax': MinimaxEngine,
-    'dlminimax': DLMinimaxEngine,
-    'human': HumanEngine,
-    'greedy': GreedyEngine
-}
+from registry import available_engines #engine classes are looked up by name there
@@ -0,0 +1,106 @@
+import argparse
+import json
+
+# game records, one JSON object per line, appended as each game finishes:
+# {"engines": ["alphabeta", "greedy"], "dim": 4, "k": 4, "time": 30, "moves": [5, 10, 6],
+#  "think": [0.41, 0.02, 0.38], "winner": 0, "reason": "win"}
+# moves are cell indices starting with player 1, think[i] is what moves[i] took off its player's
+# clock, winner and reason are as in ttt.GameResult
+
+REASONS = ['win', 'draw', 'timeout', 'exception']
+
+def make_record(engine1, engine2, dim, k, time_limit, result):
+    return {
+        'engines': [engine1, engine2],
+        'dim': dim,
+        'k': k,
+        'time': time_limit,
+        'moves': result.moves,
+        'think': [round(t, 4) for t in result.think],
+        'winner': result.winner,
+        'reason': result.reason,
+    }
+
+def append_record(path, record):
+    # a single unbuffered write, so games finishing at once in different processes don't interleave
+    with open(path, 'ab', buffering=0) as f:
+        f.write(json.dumps(record, separators=(',', ':')).encode() + b'\n')
+
+def read_records(path):
+    # one record at a time, the log is never loaded whole
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+def matchup(record):
+    return tuple(record['engines']), record['dim'], record['k'], record['time']
+
+def summarize(records, chunk_size=4096):
+    # win, draw, timeout and exception rates and mean think time per ply for every matchup
+    # (engines, dim, k, time). records are taken chunk_size at a time into numpy arrays, so
+    # memory stays bounded however long the log is
+    import numpy as np
+    totals = {}
+    chunk = []
+
+    def add_chunk():
+        groups = {}
+        for record in chunk:
+            groups.setdefault(matchup(record), []).append(record)
+        for key, group in groups.items():
+            t = totals.setdefault(key, {'outcomes': np.zeros((2, 4), dtype=np.int64), 'draws': 0,
+                                        'think_sum': np.zeros(0), 'think_count': np.zeros(0, dtype=np.int64)})
+            winners = np.array([r['winner'] for r in group])
+            reasons = np.array([REASONS.index(r['reason']) for r in group])
+            decided = winners >= 0
+            # outcomes[player, reason]: games player won for that reason (timeout/exception by the other side)
+            np.add.at(t['outcomes'], (winners[decided], reasons[decided]), 1)
+            t['draws'] += int((~decided).sum())
+            plies = max(len(r['think']) for r in group)
+            think = np.full((len(group), plies), np.nan)
+            for row, r in zip(think, group):
+                row[:len(r['think'])] = r['think']
+            if plies > len(t['think_sum']):
+                t['think_sum'] = np.pad(t['think_sum'], (0, plies - len(t['think_sum'])))
+                t['think_count'] = np.pad(t['think_count'], (0, plies - len(t['think_count'])))
+            t['think_sum'][:plies] += np.nansum(think, axis=0)
+            t['think_count'][:plies] += (~np.isnan(think)).sum(axis=0)
+        chunk.clear()
+
+    for record in records:
+        chunk.append(record)
+        if len(chunk) >= chunk_size:
+            add_chunk()
+    if chunk:
+        add_chunk()
+
+    summary = {}
+    for key, t in totals.items():
+        outcomes = t['outcomes']
+        games = int(outcomes.sum()) + t['draws']
+        win, timeout, exception = (REASONS.index(reason) for reason in ('win', 'timeout', 'exception'))
+        summary[key] = {
+            'games': games,
+            'p1_win_rate': outcomes[0, win]/games,
+            'p2_win_rate': outcomes[1, win]/games,
+            'draw_rate': t['draws']/games,
+            'p1_timeout_rate': outcomes[1, timeout]/games, #p1 timed out, so p2 won
+            'p2_timeout_rate': outcomes[0, timeout]/games,
+            'p1_exception_rate': outcomes[1, exception]/games,
+            'p2_exception_rate': outcomes[0, exception]/games,
+            'think_per_ply': t['think_sum']/np.maximum(t['think_count'], 1),
+        }
+    return summary
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Summarize a game record log written by ttt.py/check.py --log.')
+    parser.add_argument('log', type=str, help='JSONL game record file')
+    parser.add_argument('--plies', type=int, default=12, help='number of plies to show think times for')
+    args = parser.parse_args()
+    for (engines, dim, k, time_limit), s in summarize(read_records(args.log)).items():
+        print(f'=== P1: {engines[0]} vs P2: {engines[1]} | dim={dim}x{dim}, k={k}, time_limit={time_limit} | {s["games"]} games ===')
+        print(f'WINS P1: {100*s["p1_win_rate"]:05.1f}%  P2: {100*s["p2_win_rate"]:05.1f}%  DRAWS: {100*s["draw_rate"]:05.1f}%')
+        print(f'TIMEOUTS P1: {100*s["p1_timeout_rate"]:05.1f}%  P2: {100*s["p2_timeout_rate"]:05.1f}%  '
+              f'EXCEPTIONS P1: {100*s["p1_exception_rate"]:05.1f}%  P2: {100*s["p2_exception_rate"]:05.1f}%')
+        print('think time per ply: ' + ' '.join(f'{t:.3f}' for t in s['think_per_ply'][:args.plies]))
@@ -0,0 +1,77 @@
+from collections.abc import Mapping
+from importlib import import_module
+
+# engines by name, as 'module:class' paths that are only imported when the engine is looked up, so
+# picking engines on the command line doesn't load every one of them (and numpy) first.
+# other packages add engines through the ttt_ai.engines entry point group, e.g. in their pyproject.toml
+#   [project.entry-points."ttt_ai.engines"]
+#   myengine = "mypackage.engine:MyEngine"
+# those are listed from the installed package metadata, nothing is imported until one is played
+
+ENTRY_POINT_GROUP = 'ttt_ai.engines'
+
+ENGINES = {
+    'random': 'engines:RandomEngine',
+    'minimax': 'engines:MinimaxEngine',
+    'dlminimax': 'engines:DLMinimaxEngine',
+    'human': 'engines:HumanEngine',
+    'greedy': 'engines:GreedyEngine'
+}
+
+def load(path):
+    module, _, attr = path.partition(':')
+    obj = import_module(module)
+    for name in attr.split('.'):
+        obj = getattr(obj, name)
+    return obj
+
+class EngineRegistry(Mapping):
+    # name -> engine class, read only like the dict it replaces apart from register().
+    # built in names win over plugins with the same name
+
+    def __init__(self, paths, group=ENTRY_POINT_GROUP):
+        self.paths = dict(paths)
+        self.group = group
+        self.classes = {} #names already imported
+        self.plugins = None #name -> entry point, read on first use
+
+    def discover(self):
+        if self.plugins is None:
+            from importlib.metadata import entry_points
+            try:
+                found = entry_points(group=self.group)
+            except TypeError: #python < 3.10
+                found = entry_points().get(self.group, ())
+            self.plugins = {ep.name: ep for ep in found if ep.name not in self.paths}
+        return self.plugins
+
+    def register(self, name, engine):
+        # engine is a class or a 'module:class' path
+        self.classes.pop(name, None)
+        if isinstance(engine, str):
+            self.paths[name] = engine
+        else:
+            self.paths[name] = f'{engine.__module__}:{engine.__qualname__}'
+            self.classes[name] = engine
+
+    def __getitem__(self, name):
+        engine = self.classes.get(name)
+        if engine is None:
+            if name in self.paths:
+                engine = load(self.paths[name])
+            else:
+                engine = self.discover()[name].load()
+            self.classes[name] = engine
+        return engine
+
+    def __contains__(self, name):
+        return name in self.paths or name in self.discover()
+
+    def __iter__(self):
+        yield from self.paths
+        yield from (name for name in self.discover() if name not in self.paths)
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+available_engines = EngineRegistry(ENGINES)
@@ -0,0 +1,204 @@
+from registry import available_engines
+from check import game_worker, next_result, GameFailed
+from itertools import combinations
+import argparse
+import math
+import multiprocessing
+import sys
+
+# round robin (or a gauntlet of one engine against the rest) over a pool of game workers. each pairing
+# alternates colours and stops as soon as a sequential probability ratio test decides which engine is
+# stronger, or at max_games. elo differences come with 95% confidence intervals, printed as results come in
+
+def expected_score(elo):
+    return 1/(1 + 10**(-elo/400))
+
+def elo_diff(score):
+    if score <= 0:
+        return float('-inf')
+    if score >= 1:
+        return float('inf')
+    return -400*math.log10(1/score - 1)
+
+def score_stats(wins, draws, losses):
+    # mean and per-game variance of the score (1 win, 1/2 draw, 0 loss)
+    n = wins + draws + losses
+    mean = (wins + draws/2)/n
+    var = (wins*(1 - mean)**2 + draws*(0.5 - mean)**2 + losses*mean**2)/n
+    return mean, var
+
+def elo_interval(wins, draws, losses, z=1.96):
+    # (elo, low, high) from the normal approximation of the mean score
+    mean, var = score_stats(wins, draws, losses)
+    margin = z*math.sqrt(var/(wins + draws + losses))
+    return elo_diff(mean), elo_diff(mean - margin), elo_diff(mean + margin)
+
+def sprt_llr(wins, draws, losses, elo0, elo1):
+    # log likelihood ratio of elo1 against elo0, normal approximation to the score distribution.
+    # half a game of each result is added to the counts, so a run of identical results still has
+    # a spread to judge by (engines that always win against each other are common here)
+    n = wins + draws + losses
+    if not n:
+        return 0
+    mean, var = score_stats(wins + 0.5, draws + 0.5, losses + 0.5)
+    s0, s1 = expected_score(elo0), expected_score(elo1)
+    return n*(s1 - s0)*(2*mean - s0 - s1)/(2*var)
+
+def sprt_bounds(alpha, beta):
+    return math.log(beta/(1 - alpha)), math.log((1 - beta)/alpha)
+
+class Pairing:
+    # results are from engines[0]'s side
+
+    def __init__(self, engines):
+        self.engines = engines
+        self.wins = self.draws = self.losses = 0
+        self.started = 0
+        self.llr = 0
+        self.decision = None
+
+    @property
+    def games(self):
+        return self.wins + self.draws + self.losses
+
+    def add(self, result, swapped):
+        if result.winner == -1:
+            self.draws += 1
+        elif (result.winner == 0) != swapped:
+            self.wins += 1
+        else:
+            self.losses += 1
+
+    def __str__(self):
+        return f'{self.engines[0]} vs {self.engines[1]}'
+
+def pairings(engines, gauntlet=None):
+    if gauntlet is not None:
+        return [Pairing((gauntlet, engine)) for engine in engines if engine != gauntlet]
+    return [Pairing(pair) for pair in combinations(engines, 2)]
+
+def elo_str(wins, draws, losses):
+    elo, low, high = elo_interval(wins, draws, losses)
+    return f'elo {elo:+.0f} [{low:+.0f}, {high:+.0f}]'
+
+def run(engines, workers, gauntlet=None, max_games=200, min_games=10, elo0=-50, elo1=50, alpha=0.05, beta=0.05,
+        **kwargs):
+    # kwargs go to ttt.play. returns the pairings with their results, raises GameFailed naming the
+    # pairing if a game can't be played (the same engine would fail every game after it)
+    lower, upper = sprt_bounds(alpha, beta)
+    pending = pairings(engines, gauntlet)
+    tasks = multiprocessing.Queue()
+    results = multiprocessing.Queue()
+    procs = [multiprocessing.Process(target=game_worker, args=(tasks, results)) for _ in range(workers)]
+    for p in procs:
+        p.start()
+    running = {} #task id -> (pairing, colours swapped)
+    task_ids = iter(range(1 << 62))
+
+    def schedule():
+        # keep every worker busy, giving the next game to the undecided pairing with the fewest started
+        while len(running) < workers:
+            open_ = [p for p in pending if p.decision is None and p.started < max_games]
+            if not open_:
+                return
+            pairing = min(open_, key=lambda p: p.started)
+            swapped = pairing.started % 2 == 1
+            engine1, engine2 = pairing.engines[::-1] if swapped else pairing.engines
+            i = next(task_ids)
+            running[i] = pairing, swapped
+            pairing.started += 1
+            tasks.put((i, dict(kwargs, engine1=engine1, engine2=engine2, delay=False)))
+
+    print(f'{len(pending)} pairings, up to {max_games} games each on {workers} workers, '
+          f'SPRT elo {elo0:+g} vs {elo1:+g} (alpha {alpha}, beta {beta})')
+    try:
+        schedule()
+        while running:
+            try:
+                i, result = next_result(results, procs)
+            except GameFailed as e:
+                playing = ', '.join(sorted({str(pairing) for pairing, _ in running.values()}))
+                raise GameFailed(f'{e} while playing {playing}') from None
+            pairing, swapped = running.pop(i)
+            if isinstance(result, GameFailed):
+                raise GameFailed(f'a game of {pairing} failed:\n{result}')
+            pairing.add(result, swapped)
+            if pairing.decision is None:
+                pairing.llr = sprt_llr(pairing.wins, pairing.draws, pairing.losses, elo0, elo1)
+                if pairing.games >= min_games:
+                    if pairing.llr >= upper:
+                        pairing.decision = f'{pairing.engines[0]} stronger'
+                    elif pairing.llr <= lower:
+                        pairing.decision = f'{pairing.engines[1]} stronger'
+                if pairing.decision is None and pairing.games >= max_games:
+                    pairing.decision = 'undecided'
+            print(f'{pairing}: +{pairing.wins} ={pairing.draws} -{pairing.losses}  '
+                  f'{elo_str(pairing.wins, pairing.draws, pairing.losses)}  llr {pairing.llr:+.2f} [{lower:.2f}, {upper:.2f}]'
+                  + (f'  SPRT: {pairing.decision}' if pairing.decision else ''), flush=True)
+            schedule()
+    except BaseException:
+        for p in procs: #don't wait for the games still running
+            p.terminate()
+        raise
+    finally:
+        for _ in procs:
+            tasks.put(None)
+        for p in procs:
+            p.join()
+    return pending
+
+def standings(results):
+    # (engine, wins, draws, losses) against the whole field, best score first
+    totals = {}
+    for pairing in results:
+        for engine, (w, l) in zip(pairing.engines, ((pairing.wins, pairing.losses), (pairing.losses, pairing.wins))):
+            t = totals.setdefault(engine, [0, 0, 0])
+            t[0] += w
+            t[1] += pairing.draws
+            t[2] += l
+    return sorted(((engine, *t) for engine, t in totals.items() if sum(t)),
+                  key=lambda row: -score_stats(*row[1:])[0])
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Round robin or gauntlet between engines, with elo estimates and SPRT early stopping.')
+    parser.add_argument('engines', type=str, nargs='+', choices=available_engines, metavar='engine', help='engines to play (%(choices)s)')
+    parser.add_argument('--gauntlet', '-g', type=str, default=None, help='play only this engine against each of the others')
+    parser.add_argument('--dim', '-d', type=int, default=3, help='size of board')
+    parser.add_argument('--time', '-t', type=float, default=30, help='each player\'s time limit')
+    parser.add_argument('--k', '-k', type=int, default=None, help='number in a row needed to win (default: size of board)')
+    parser.add_argument('--workers', '-w', type=int, default=multiprocessing.cpu_count(), help='number of games to run in parallel')
+    parser.add_argument('--max-games', type=int, default=200, help='games per pairing if SPRT doesn\'t decide first')
+    parser.add_argument('--min-games', type=int, default=10, help='games per pairing before SPRT may stop it')
+    parser.add_argument('--elo0', type=float, default=-50, help='SPRT: elo difference meaning the second engine is stronger')
+    parser.add_argument('--elo1', type=float, default=50, help='SPRT: elo difference meaning the first engine is stronger')
+    parser.add_argument('--alpha', type=float, default=0.05, help='SPRT: chance of wrongly deciding for the first engine')
+    parser.add_argument('--beta', type=float, default=0.05, help='SPRT: chance of wrongly deciding for the second engine')
+    parser.add_argument('--ponder', action='store_true', help='let engines keep searching on the opponent\'s time')
+    parser.add_argument('--log', type=str, default=None, help='append a record of every game to this JSONL file (summarize it with records.py)')
+    args = parser.parse_args()
+    engines = list(dict.fromkeys(args.engines))
+    for name in engines + ([args.gauntlet] if args.gauntlet else []):
+        if name not in available_engines or name == 'human':
+            parser.error(f'unknown engine {name}')
+    if args.gauntlet and args.gauntlet not in engines:
+        engines.insert(0, args.gauntlet)
+    if len(engines) < 2:
+        parser.error('need at least two engines')
+    if args.k is not None and not 1 <= args.k <= args.dim:
+        parser.error('k must be between 1 and the size of the board')
+    if args.elo0 >= args.elo1:
+        parser.error('elo0 has to be below elo1')
+    try:
+        results = run(engines, args.workers, args.gauntlet, args.max_games, args.min_games, args.elo0, args.elo1,
+                      args.alpha, args.beta, dim=args.dim, time_limit=args.time, k=args.k or args.dim, ponder=args.ponder,
+                      log=args.log)
+    except GameFailed as e:
+        sys.exit(f'tournament stopped: {e}')
+    print(f'\n=== dim={args.dim}x{args.dim}, k={args.k or args.dim}, time_limit={args.time} ===')
+    for pairing in results:
+        if pairing.games:
+            print(f'{str(pairing):<30} {pairing.games:4d} games  +{pairing.wins} ={pairing.draws} -{pairing.losses}  '
+                  f'{elo_str(pairing.wins, pairing.draws, pairing.losses)}  {pairing.decision}')
+    print('== STANDINGS (against the field) ==')
+    for engine, w, d, l in standings(results):
+        print(f'{engine:<12} +{w} ={d} -{l}  {elo_str(w, d, l)}')